@@ -0,0 +1,189 @@
+"""
+Admission control for `request_token`.
+
+Three checks run before a token is added, each O(1) per request:
+
+- TokenBuckets rate-limit requests per socket id and per remote address.
+  Students in one lecture hall often share a NAT address, so the address
+  bucket is meant to be much more generous than the per-socket one.
+- The queue's maximum length, enforced by the backend when it adds the token
+  (add_token returns None when the queue is full).
+- ActiveTokens refuses a second token from a client whose earlier token is
+  still waiting in the same queue.
+"""
+import threading
+import time
+
+RATE_LIMITED = 'rate_limited'
+QUEUE_FULL = 'queue_full'
+DUPLICATE = 'duplicate'
+
+MESSAGES = {
+    RATE_LIMITED: 'Too many token requests, please wait a moment',
+    QUEUE_FULL: 'The queue is full, please try again later',
+    DUPLICATE: 'You already have a token in this queue',
+}
+
+
+class TokenBuckets:
+    """
+    One token bucket per key: up to `burst` requests at once, refilled at
+    `rate` per second. A rate of 0 disables the limit.
+
+    Once the table reaches `max_keys`, buckets idle long enough to be full
+    again are dropped, then the oldest if that is not enough, leaving room
+    for a tenth of `max_keys` new keys. Memory stays bounded and the sweep
+    is amortised O(1) per request.
+    """
+
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._sweep(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def forget(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _sweep(self, now):
+        full_after = self.burst / self.rate
+        idle = [key for key, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        excess = len(self._buckets) - int(self.max_keys * 0.9)
+        if excess > 0:
+            # Dicts keep insertion order, so these are the longest-tracked keys
+            for key in list(self._buckets)[:excess]:
+                del self._buckets[key]
+
+
+class ActiveTokens:
+    """
+    The waiting token of each (professor id, client key) pair.
+
+    A request is identified by several keys, e.g. its socket id and the
+    client id the page sends. It is refused if any of them already has a
+    token waiting, so neither a reconnect (new socket, same client id) nor a
+    socket rotating its client id gets a second token.
+
+    `reserve` is called before adding a token and `assign` after; a
+    concurrent second request with a shared key sees the reservation and
+    is refused. `is_queued(professor_id, token_id)` asks the backend whether
+    a remembered token is still waiting, so entries for tokens served by
+    another worker go stale harmlessly. `forget_client` drops a key that
+    can't come back (a disconnected socket id), and at most `max_tokens`
+    tokens are remembered: past that, the oldest tenth is forgotten, so
+    stale entries can't pile up. `owns` tells `cancel_token` whether a
+    client requested a token.
+    """
+
+    _PENDING = object()
+
+    def __init__(self, is_queued, max_tokens=100_000):
+        self.is_queued = is_queued
+        self.max_tokens = max_tokens
+        self._tokens = {}   # (professor id, client key) -> token id, or _PENDING
+        self._owners = {}   # (professor id, token id) -> client keys, oldest first
+        self._clients = {}  # client key -> professor ids it has an entry in _tokens for
+        self._lock = threading.Lock()
+
+    def reserve(self, professor_id, clients):
+        """Claim every key in `clients` for a queue before adding a token.
+
+        Returns (True, None) if the request may go ahead, or (False, token id)
+        if one of the keys already has a token waiting (id None while that
+        token is still being added).
+        """
+        keys = [(professor_id, client) for client in clients]
+        with self._lock:
+            current = [self._tokens.get(key) for key in keys]
+            if all(token_id is None for token_id in current):
+                for key in keys:
+                    self._set(key, self._PENDING)
+                return True, None
+        if any(token_id is self._PENDING for token_id in current):
+            return False, None
+        for token_id in current:
+            if token_id is not None and self.is_queued(professor_id, token_id):
+                return False, token_id
+        with self._lock:
+            if [self._tokens.get(key) for key in keys] != current:
+                return False, None  # Lost a race with another request sharing a key
+            for token_id in current:
+                if token_id is not None:
+                    self._forget(professor_id, token_id)
+            for key in keys:
+                self._set(key, self._PENDING)
+        return True, None
+
+    def assign(self, professor_id, clients, token_id):
+        with self._lock:
+            for client in clients:
+                self._set((professor_id, client), token_id)
+            self._owners[(professor_id, token_id)] = tuple(clients)
+            if len(self._owners) > self.max_tokens:
+                # Dicts keep insertion order, so these are the longest-held tokens
+                for owner in list(self._owners)[:len(self._owners) - int(self.max_tokens * 0.9)]:
+                    self._forget(*owner)
+
+    def cancel(self, professor_id, clients):
+        """Drop a reservation whose token was not added"""
+        with self._lock:
+            for client in clients:
+                if self._tokens.get((professor_id, client)) is self._PENDING:
+                    self._delete((professor_id, client))
+
+    def release(self, professor_id, token_id):
+        """Forget a token once it leaves the queue (served or cancelled)"""
+        with self._lock:
+            self._forget(professor_id, token_id)
+
+    def owns(self, professor_id, clients, token_id):
+        """Whether any key in `clients` requested `token_id` and it has not been released"""
+        return any(self._tokens.get((professor_id, client)) == token_id for client in clients)
+
+    def forget_client(self, client):
+        """Drop every entry of a key that can't be used again, e.g. a disconnected socket id"""
+        with self._lock:
+            for professor_id in list(self._clients.get(client, ())):
+                token_id = self._tokens.get((professor_id, client))
+                self._delete((professor_id, client))
+                owners = self._owners.get((professor_id, token_id))
+                if owners is not None and not any(self._tokens.get((professor_id, other)) == token_id
+                                                  for other in owners):
+                    del self._owners[(professor_id, token_id)]
+
+    def _forget(self, professor_id, token_id):
+        for client in self._owners.pop((professor_id, token_id), ()):
+            if self._tokens.get((professor_id, client)) == token_id:
+                self._delete((professor_id, client))
+
+    def _set(self, key, token_id):
+        self._tokens[key] = token_id
+        self._clients.setdefault(key[1], set()).add(key[0])
+
+    def _delete(self, key):
+        if self._tokens.pop(key, None) is not None:
+            professor_ids = self._clients[key[1]]
+            professor_ids.discard(key[0])
+            if not professor_ids:
+                del self._clients[key[1]]
@@ -0,0 +1,111 @@
+"""
+Concurrency benchmark for db_mongo.book_timeslot.
+
+Starts N parallel bookers against a single timeslot and reports bookings
+per second, rejections, and whether the slot was oversold (booked_count or
+the number of booking documents exceeding capacity).
+
+Runs against MONGO_URI (a standalone mongod is enough) using a throwaway
+database (--db, default lineup_bench). Pass --inmemory to use mongomock
+instead of a server. That only checks the benchmark runs: mongomock is not
+thread-safe, so concurrent bookers can race inside it and its oversold count
+says nothing about book_timeslot. Only a run against a real mongod shows that
+the slot is never oversold, and only that run's exit status checks it.
+
+Usage:
+    python benchmarks/bench_booking.py [--bookers 500] [--capacity 50] [--inmemory]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_mongo
+
+
+def setup(inmemory, db_name):
+    # Never the application database: the benchmark drops its collections
+    os.environ['MONGO_DB'] = db_name
+    if inmemory:
+        import mongomock
+        db_mongo._client = mongomock.MongoClient()
+        db_mongo._db = db_mongo._client.get_database(os.environ['MONGO_DB'])
+    db = db_mongo.get_db()
+    db.timeslots.drop()
+    db.bookings.drop()
+    return db
+
+
+def run(bookers, capacity):
+    start = datetime.utcnow() + timedelta(days=1)
+    slot = db_mongo.create_timeslot(start, start + timedelta(minutes=30), capacity=capacity)
+    slot_id = str(slot['_id'])
+
+    barrier = threading.Barrier(bookers)
+    results = {'booked': 0, 'full': 0, 'error': 0}
+    lock = threading.Lock()
+
+    def booker(i):
+        barrier.wait()
+        try:
+            db_mongo.book_timeslot(slot_id, f"student{i}")
+            outcome = 'booked'
+        except RuntimeError:
+            outcome = 'full'
+        except Exception:
+            outcome = 'error'
+        with lock:
+            results[outcome] += 1
+
+    threads = [threading.Thread(target=booker, args=(i,)) for i in range(bookers)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    db = db_mongo.get_db()
+    booked_count = db.timeslots.find_one({'_id': slot['_id']})['booked_count']
+    booking_docs = db.bookings.count_documents({'timeslot_id': slot['_id']})
+    return results, elapsed, booked_count, booking_docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bookers', type=int, default=500)
+    parser.add_argument('--capacity', type=int, default=50)
+    parser.add_argument('--db', default='lineup_bench', help='throwaway database name')
+    parser.add_argument('--inmemory', action='store_true', help='use mongomock instead of MONGO_URI (smoke test only, not thread-safe)')
+    args = parser.parse_args()
+
+    db = setup(args.inmemory, args.db)
+    results, elapsed, booked_count, booking_docs = run(args.bookers, args.capacity)
+    oversold = max(booked_count, booking_docs) - args.capacity
+
+    print(f"bookers:           {args.bookers}")
+    print(f"capacity:          {args.capacity}")
+    print(f"elapsed:           {elapsed:.3f} s")
+    print(f"attempts/sec:      {args.bookers / elapsed:,.0f}")
+    print(f"bookings/sec:      {results['booked'] / elapsed:,.0f}")
+    print(f"booked / full / error: {results['booked']} / {results['full']} / {results['error']}")
+    print(f"booked_count:      {booked_count}")
+    print(f"booking documents: {booking_docs}")
+    print(f"oversold:          {max(oversold, 0)}")
+    if args.inmemory:
+        print("\nmongomock is not thread-safe: these counts do not show whether bookings oversell.\n"
+              "Zero oversold is only proven by a run against a real mongod (MONGO_URI).")
+
+    db.timeslots.drop()
+    db.bookings.drop()
+    if args.inmemory:
+        sys.exit(0)
+    sys.exit(1 if oversold > 0 or booked_count != booking_docs else 0)
+
+
+if __name__ == '__main__':
+    main()
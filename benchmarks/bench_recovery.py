@@ -0,0 +1,73 @@
+"""
+Benchmark for the queue write-ahead log.
+
+Measures the cost of QueueLog.append on the request path, then times
+recovery (replaying the log into fresh shards) against log length, with and
+without a snapshot covering most of the log.
+
+Usage: python benchmarks/bench_recovery.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queue_log import QueueLog
+from queue_shard import ShardRegistry
+
+LENGTHS = [1_000, 10_000, 100_000, 500_000]
+PROFESSORS = 10
+
+
+def write_log(directory, records, snapshot_at=None):
+    """Write `records` deltas across PROFESSORS shards; returns mean append cost in ns"""
+    shards = ShardRegistry()
+    log = QueueLog(directory, flush_interval=0.05)
+    log.start()
+    append_ns = 0
+    for i in range(records):
+        shard = shards.get(f"prof{i % PROFESSORS}")
+        with shard.lock:
+            # Mostly joins with a serve every third record keeps queues realistic
+            delta = shard.serve_next() if i % 3 == 2 else shard.add_token(f"student{i}", 'General')
+            start = time.perf_counter_ns()
+            log.append(shard.professor_id, delta)
+            append_ns += time.perf_counter_ns() - start
+        if snapshot_at is not None and i == snapshot_at:
+            segment = log.rotate()
+            snaps = []
+            for s in shards:
+                with s.lock:
+                    snaps.append(s.snapshot())
+            log.write_snapshot(segment, snaps)
+    log.close()
+    return append_ns / records
+
+
+def time_recovery(directory):
+    start = time.perf_counter()
+    replayed = QueueLog(directory).recover(ShardRegistry())
+    return time.perf_counter() - start, replayed
+
+
+def main():
+    print(f"{'records':>10} {'append ns':>10} {'full replay s':>14} {'snapshot+tail s':>16} {'tail':>8}")
+    for n in LENGTHS:
+        full_dir = tempfile.mkdtemp(prefix='lineup-wal-')
+        snap_dir = tempfile.mkdtemp(prefix='lineup-wal-')
+        try:
+            append_ns = write_log(full_dir, n)
+            full_s, _ = time_recovery(full_dir)
+            write_log(snap_dir, n, snapshot_at=int(n * 0.9))
+            snap_s, tail = time_recovery(snap_dir)
+            print(f"{n:>10,} {append_ns:>10.0f} {full_s:>14.3f} {snap_s:>16.3f} {tail:>8,}")
+        finally:
+            shutil.rmtree(full_dir)
+            shutil.rmtree(snap_dir)
+
+
+if __name__ == '__main__':
+    main()
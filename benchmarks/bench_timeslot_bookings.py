@@ -0,0 +1,156 @@
+"""
+Benchmark for db_mongo.list_timeslots_with_bookings (GET /api/timeslots/bookings).
+
+Seeds --slots timeslots (30 minutes apart) and --bookings bookings spread
+evenly over them, then reports:
+
+- one page of slots with their bookings, and with per-status counts only,
+  at the start of the range and from a start time in the middle of it
+- walking every page of the range with the aggregation
+- the same first page fetched the old way: the slot page, then one bookings
+  query per slot
+
+Runs against MONGO_URI using a throwaway database (--db, default
+lineup_bench). It needs a real mongod, 5.0 or newer: mongomock does not
+implement $lookup with a pipeline.
+
+Usage:
+    python benchmarks/bench_timeslot_bookings.py [--slots 10000] [--bookings 100000] [--limit 100]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_mongo
+
+REPEAT = 20
+BATCH = 10_000
+
+
+def setup(db_name):
+    # Never the application database: the benchmark drops its collections
+    os.environ['MONGO_DB'] = db_name
+    db = db_mongo.get_db()
+    db.timeslots.drop()
+    db.bookings.drop()
+    db_mongo.ensure_indexes()
+    return db
+
+
+def seed(db, slots, bookings):
+    base = datetime(2030, 1, 1, 8, 0)
+    now = datetime.utcnow()
+    per_slot = -(-bookings // slots)
+    slot_docs = [{
+        '_id': ObjectId(),
+        'start_ts': base + timedelta(minutes=30 * i),
+        'end_ts': base + timedelta(minutes=30 * i + 30),
+        'capacity': per_slot,
+        'label': f"Slot {i}",
+        'booked_count': 0,
+        'is_active': True,
+        'created_at': now,
+        'updated_at': now
+    } for i in range(slots)]
+    for i in range(0, slots, BATCH):
+        db.timeslots.insert_many(slot_docs[i:i + BATCH], ordered=False)
+
+    batch = []
+    for i in range(bookings):
+        slot = slot_docs[i % slots]
+        slot['booked_count'] += 1
+        batch.append({
+            'timeslot_id': slot['_id'],
+            'name': f"student{i}",
+            'contact': None,
+            'status': 'cancelled' if i % 10 == 0 else 'booked',
+            'created_at': now
+        })
+        if len(batch) == BATCH:
+            db.bookings.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.bookings.insert_many(batch, ordered=False)
+    return slot_docs
+
+
+def median_ms(fn):
+    fn()  # Warm up caches and the plan cache
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def per_slot_queries(db, limit):
+    docs, _ = db_mongo.list_timeslots_page(limit=limit)
+    for doc in docs:
+        doc['bookings'] = list(db.bookings.find({'timeslot_id': doc['_id']}, {'timeslot_id': 0}))
+    return docs
+
+
+def walk(counts_only, limit):
+    after, pages = None, 0
+    while True:
+        _, after = db_mongo.list_timeslots_with_bookings(limit=limit, after=after, counts_only=counts_only)
+        pages += 1
+        if after is None:
+            return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--slots', type=int, default=10_000)
+    parser.add_argument('--bookings', type=int, default=100_000)
+    parser.add_argument('--limit', type=int, default=100, help='page size')
+    parser.add_argument('--db', default='lineup_bench', help='throwaway database name')
+    args = parser.parse_args()
+
+    db = setup(args.db)
+    start = time.perf_counter()
+    slot_docs = seed(db, args.slots, args.bookings)
+    print(f"seeded {args.slots:,} slots and {args.bookings:,} bookings in {time.perf_counter() - start:.1f} s\n")
+
+    middle = slot_docs[len(slot_docs) // 2]['start_ts']
+    rows = [
+        ('aggregation, bookings, first page',
+         lambda: db_mongo.list_timeslots_with_bookings(limit=args.limit)),
+        ('aggregation, counts, first page',
+         lambda: db_mongo.list_timeslots_with_bookings(limit=args.limit, counts_only=True)),
+        ('aggregation, bookings, from middle',
+         lambda: db_mongo.list_timeslots_with_bookings(start_from=middle, limit=args.limit)),
+        ('aggregation, counts, from middle',
+         lambda: db_mongo.list_timeslots_with_bookings(start_from=middle, limit=args.limit, counts_only=True)),
+        (f"page + {args.limit} per-slot queries",
+         lambda: per_slot_queries(db, args.limit)),
+    ]
+    print(f"page of {args.limit} slots (median of {REPEAT})")
+    for name, fn in rows:
+        print(f"  {name:<40}{median_ms(fn):>10.1f} ms")
+
+    print("\nwalking every page")
+    for counts_only in (False, True):
+        start = time.perf_counter()
+        pages = walk(counts_only, args.limit)
+        elapsed = time.perf_counter() - start
+        name = 'counts' if counts_only else 'bookings'
+        print(f"  {name:<40}{elapsed * 1000:>10.1f} ms  ({pages} pages, {elapsed / pages * 1000:.1f} ms/page)")
+
+    docs, _ = db_mongo.list_timeslots_with_bookings(limit=args.limit, counts_only=True)
+    assert all(sum(d['booking_counts'].values()) == d['booked_count'] for d in docs), 'counts disagree with booked_count'
+
+    db.timeslots.drop()
+    db.bookings.drop()
+
+
+if __name__ == '__main__':
+    main()
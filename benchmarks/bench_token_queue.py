@@ -0,0 +1,63 @@
+"""
+Micro-benchmark for TokenQueue.
+
+Times dequeue, lookup, position and removal at increasing queue sizes and
+compares dequeue against the old list.pop(0). Per-op times for TokenQueue
+should stay flat as the queue grows.
+
+Usage: python benchmarks/bench_token_queue.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_queue import Token, TokenQueue
+
+SIZES = [1_000, 10_000, 100_000]
+OPS = 1_000
+
+
+def build(n):
+    q = TokenQueue()
+    for i in range(n):
+        q.append(Token(i, f"student{i}", 'General', '00:00:00'))
+    return q
+
+
+def per_op_ns(fn, ops=OPS):
+    start = time.perf_counter_ns()
+    fn()
+    return (time.perf_counter_ns() - start) / ops
+
+
+def bench(n):
+    results = {}
+
+    q = build(n)
+    results['popleft'] = per_op_ns(lambda: [q.popleft() for _ in range(OPS)])
+
+    q = build(n)
+    mid = n // 2
+    results['get'] = per_op_ns(lambda: [q.get(mid) for _ in range(OPS)])
+    results['position'] = per_op_ns(lambda: [q.position(n - 1) for _ in range(OPS)])
+    results['remove'] = per_op_ns(lambda: [q.remove(i) for i in range(mid, mid + OPS)])
+    # Position with OPS pending cancellations ahead of the token
+    results['position (1k cancelled)'] = per_op_ns(lambda: [q.position(n - 1) for _ in range(OPS)])
+
+    lst = [{'id': i} for i in range(n)]
+    results['list.pop(0)'] = per_op_ns(lambda: [lst.pop(0) for _ in range(OPS)])
+    return results
+
+
+def main():
+    rows = {n: bench(n) for n in SIZES}
+    ops = list(rows[SIZES[0]])
+    print(f"{'op (ns/op)':<26}" + ''.join(f"{n:>12,}" for n in SIZES))
+    for op in ops:
+        print(f"{op:<26}" + ''.join(f"{rows[n][op]:>12.0f}" for n in SIZES))
+
+
+if __name__ == '__main__':
+    main()
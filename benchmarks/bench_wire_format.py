@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for the Socket.IO wire formats.
+
+Encodes a `state_update` snapshot packet with python-socketio's JSON and
+MessagePack packet classes, for queues of increasing length, and reports
+packet size plus encode and decode time. Dict tokens are the json format;
+positional tokens over msgpack are LINEUP_WIRE_FORMAT=msgpack. The two mixed
+rows show how much of the saving comes from each half.
+
+Usage: python benchmarks/bench_wire_format.py   (needs the msgpack package)
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from wire_format import pack_state
+
+SIZES = [10, 100, 1_000]
+REPEAT = 200
+
+
+def snapshot(n):
+    return {
+        'professor_id': 'default',
+        'professor_status': 'Available',
+        'current_token': {'id': 0, 'name': 'student0', 'type': 'Doubt Clarification', 'timestamp': '14:00:00'},
+        'queue': [
+            {'id': i, 'name': f"student{i}", 'type': 'Doubt Clarification', 'timestamp': '14:00:00'}
+            for i in range(1, n + 1)
+        ],
+        'token_counter': n + 1,
+        'version': n
+    }
+
+
+FORMATS = [
+    ('json, dict tokens', packet.Packet, False),
+    ('json, positional tokens', packet.Packet, True),
+    ('msgpack, dict tokens', MsgPackPacket, False),
+    ('msgpack, positional tokens', MsgPackPacket, True),
+]
+
+
+def per_op_us(fn):
+    start = time.perf_counter_ns()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter_ns() - start) / REPEAT / 1000
+
+
+def bench(n):
+    source = snapshot(n)
+    results = {}
+    for name, packet_class, positional in FORMATS:
+        def encode():
+            # Positional encodes include building the compact copy, as the server does
+            state = pack_state(source) if positional else source
+            return packet_class(packet.EVENT, data=['state_update', state]).encode()
+
+        encoded = encode()
+        results[name] = {
+            'bytes': len(encoded),
+            'encode_us': per_op_us(encode),
+            'decode_us': per_op_us(lambda: packet_class(encoded_packet=encoded))
+        }
+    return results
+
+
+def main():
+    for n in SIZES:
+        rows = bench(n)
+        baseline = rows[FORMATS[0][0]]['bytes']
+        print(f"\n{n:,} tokens")
+        print(f"  {'format':<28}{'bytes':>10}{'vs json':>10}{'encode us':>12}{'decode us':>12}")
+        for name, row in rows.items():
+            print(f"  {name:<28}{row['bytes']:>10,}{row['bytes'] / baseline:>10.0%}"
+                  f"{row['encode_us']:>12.1f}{row['decode_us']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
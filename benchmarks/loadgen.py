@@ -0,0 +1,391 @@
+"""
+Socket.IO load generator and latency benchmark for the LineUp server.
+
+Starts server.py locally (or targets --url), connects a swarm of
+python-socketio student clients plus one professor to a single queue, and
+drives request_token / next_token at fixed rates. It reports:
+
+- end-to-end broadcast latency (request_token sent -> token_added received,
+  across every subscribed client), p50/p90/p99/max
+- throughput of requests and delivered deltas
+- server CPU time and memory (Linux /proc; only when the harness started it)
+- payload bytes received per client
+
+With --rest it also exercises the timeslot endpoints: a bulk create, then
+paged GET /api/timeslots and POST .../book from a pool of workers. Use
+--inmemory-mongo to run the server against mongomock instead of MONGO_URI.
+
+Results are written as JSON (--out) and can be compared with an earlier run
+(--compare baseline.json).
+
+Usage:
+    python benchmarks/loadgen.py --students 100 --join-rate 50 --serve-rate 5 --duration 20
+    python benchmarks/loadgen.py --rest --inmemory-mongo --out results.json
+    python benchmarks/loadgen.py --compare results.json --out new.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the server in a child process. Mirrors serve.py, plus an optional
+# mongomock stand-in injected before server.py connects to MongoDB.
+BOOTSTRAP = """
+import os, sys
+sys.path.insert(0, {root!r})
+if {eventlet!r}:
+    os.environ['LINEUP_ASYNC_MODE'] = 'eventlet'
+    import eventlet
+    eventlet.monkey_patch()
+if {inmemory!r}:
+    import mongomock, db_mongo
+    db_mongo._client = mongomock.MongoClient()
+    db_mongo._db = db_mongo._client.get_database('lineup_loadgen')
+import server
+server.run(host='127.0.0.1', port={port})
+"""
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def pick(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+    return {
+        'count': len(values),
+        'p50_ms': pick(50) * 1000,
+        'p90_ms': pick(90) * 1000,
+        'p99_ms': pick(99) * 1000,
+        'max_ms': values[-1] * 1000,
+        'mean_ms': sum(values) / len(values) * 1000
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """server.py in a child process, with /proc-based resource sampling"""
+
+    def __init__(self, port, eventlet, inmemory, env):
+        self.port = port
+        code = BOOTSTRAP.format(root=ROOT, eventlet=eventlet, inmemory=inmemory, port=port)
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', code],
+            env=dict(os.environ, **env),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        self._cpu_start = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError('Server exited: ' + self.proc.stderr.read().decode(errors='replace')[-2000:])
+            try:
+                urllib.request.urlopen(self.url + '/api/broadcast/stats', timeout=1).read()
+                self._cpu_start = self.cpu_seconds()
+                return
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.2)
+        raise RuntimeError('Server did not start in time')
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def memory(self):
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+            return {
+                'rss_mb': int(status['VmRSS'].split()[0]) / 1024,
+                'peak_rss_mb': int(status['VmHWM'].split()[0]) / 1024
+            }
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def resources(self, elapsed):
+        cpu = self.cpu_seconds()
+        result = {'memory': self.memory()}
+        if cpu is not None and self._cpu_start is not None:
+            result['cpu_seconds'] = cpu - self._cpu_start
+            result['cpu_percent'] = (cpu - self._cpu_start) / elapsed * 100
+        return result
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class Client:
+    """One Socket.IO client that records delivery latency and received bytes"""
+
+    def __init__(self, url, professor_id, latencies, lock, window=None):
+        self.sio = socketio.Client(reconnection=False)
+        self.bytes = 0
+        self.deltas = 0
+        self.views = 0
+        self._latencies = latencies
+        self._lock = lock
+        self.sio.on('state_update', self._on_snapshot)
+        self.sio.on('state_delta', lambda d: self._on_deltas([d]))
+        self.sio.on('state_deltas', self._on_deltas)
+        self.sio.on('queue_view', self._on_view)
+        self.sio.on('queue_position', self._on_snapshot)
+        query = f"professor={professor_id}"
+        if window:
+            query += f"&view=window&window={window}"
+        self.sio.connect(f"{url}?{query}", transports=['websocket'], wait_timeout=10)
+
+    def _on_snapshot(self, data):
+        self.bytes += len(data) if isinstance(data, (str, bytes)) else len(json.dumps(data))
+
+    def _on_view(self, data):
+        self.views += 1
+        self._on_snapshot(data)
+
+    def _on_deltas(self, deltas):
+        now = time.time()
+        self.bytes += len(json.dumps(deltas))
+        samples = []
+        for delta in deltas:
+            self.deltas += 1
+            token = delta.get('token') if isinstance(delta, dict) else None
+            if delta.get('type') == 'token_added' and token and str(token.get('name', '')).startswith('lg:'):
+                samples.append(now - float(token['name'][3:]))
+        if samples:
+            with self._lock:
+                self._latencies.extend(samples)
+
+    def close(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+def paced(rate, duration, action):
+    """Call action() `rate` times per second for `duration` seconds; returns calls made"""
+    if rate <= 0:
+        return 0
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    calls = 0
+    while True:
+        target = start + calls * interval
+        now = time.perf_counter()
+        if target - start >= duration:
+            return calls
+        if target > now:
+            time.sleep(target - now)
+        action()
+        calls += 1
+
+
+def run_queue_phase(args, url):
+    latencies = []
+    lock = threading.Lock()
+    professor_id = f"loadgen-{os.getpid()}"
+
+    students = []
+    for _ in range(args.students):
+        students.append(Client(url, professor_id, latencies, lock, window=args.window))
+    professor = Client(url, professor_id, latencies, lock)
+    time.sleep(0.5)
+
+    sent = {'request_token': 0, 'next_token': 0}
+
+    def join():
+        random.choice(students).sio.emit('request_token', {'name': f"lg:{time.time()}", 'type': 'Load'})
+
+    def serve():
+        professor.sio.emit('next_token')
+
+    start = time.perf_counter()
+    server_thread = threading.Thread(target=lambda: sent.__setitem__('next_token', paced(args.serve_rate, args.duration, serve)))
+    server_thread.start()
+    sent['request_token'] = paced(args.join_rate, args.duration, join)
+    server_thread.join()
+    time.sleep(1.0)  # Let the last broadcasts land
+    elapsed = time.perf_counter() - start
+
+    clients = students + [professor]
+    received = [c.bytes for c in clients]
+    result = {
+        'clients': len(clients),
+        'duration_s': elapsed,
+        'sent': sent,
+        'requests_per_s': (sent['request_token'] + sent['next_token']) / elapsed,
+        'deltas_delivered': sum(c.deltas for c in clients),
+        'deltas_delivered_per_s': sum(c.deltas for c in clients) / elapsed,
+        'views_delivered': sum(c.views for c in clients),
+        'broadcast_latency': percentiles(latencies),
+        'bytes_per_client': {
+            'mean': sum(received) / len(received),
+            'max': max(received)
+        }
+    }
+    for c in clients:
+        c.close()
+    return result
+
+
+def http(method, url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            payload = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        status = e.code
+    return status, payload, time.perf_counter() - start
+
+
+def run_rest_phase(args, url):
+    # Seed a term's worth of slots in one request
+    status, payload, create_latency = http('POST', url + '/api/timeslots/bulk', {'recurrence': {
+        'freq': 'daily', 'start_date': '2030-01-01', 'end_date': '2030-03-31',
+        'start_time': '09:00', 'duration_minutes': 15, 'slots_per_day': 8,
+        'capacity': args.slot_capacity, 'label': 'loadgen'
+    }})
+    if status != 201:
+        return {'error': f"bulk create failed ({status}): {payload[:200]!r}"}
+    slot_ids = json.loads(payload)['ids']
+
+    stats = {'list': [], 'book': []}
+    statuses = {'list': {}, 'book': {}}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.rest_duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            if random.random() < args.book_ratio:
+                kind = 'book'
+                status, _, latency = http('POST', f"{url}/api/timeslots/{random.choice(slot_ids)}/book", {'name': 'loadgen'})
+            else:
+                kind = 'list'
+                status, _, latency = http('GET', f"{url}/api/timeslots?limit=50")
+            with lock:
+                stats[kind].append(latency)
+                statuses[kind][status] = statuses[kind].get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.rest_workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'slots_created': len(slot_ids),
+        'bulk_create_ms': create_latency * 1000,
+        'duration_s': elapsed,
+        'requests_per_s': (len(stats['list']) + len(stats['book'])) / elapsed,
+        'list_latency': percentiles(stats['list']),
+        'book_latency': percentiles(stats['book']),
+        'status_codes': {k: {str(code): n for code, n in v.items()} for k, v in statuses.items()}
+    }
+
+
+def compare(baseline, current, prefix=''):
+    """Print numeric differences between two result trees"""
+    for key, value in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            compare(old or {}, value, name + '.')
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            change = (value - old) / old * 100 if old else 0.0
+            print(f"  {name:<45} {old:>12.2f} -> {value:>12.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LineUp Socket.IO load generator')
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--threading', action='store_true', help='start the server in threading mode instead of eventlet')
+    parser.add_argument('--inmemory-mongo', action='store_true', help='run the started server against mongomock')
+    parser.add_argument('--window-ms', type=float, help='LINEUP_BROADCAST_WINDOW_MS for the started server')
+    parser.add_argument('--students', type=int, default=50)
+    parser.add_argument('--join-rate', type=float, default=20, help='request_token per second (all students)')
+    parser.add_argument('--serve-rate', type=float, default=2, help='next_token per second')
+    parser.add_argument('--window', type=int,
+                        help='students subscribe to a windowed view of this many tokens (latency then comes from the professor)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of queue load')
+    parser.add_argument('--rest', action='store_true', help='also benchmark the timeslot REST endpoints')
+    parser.add_argument('--rest-workers', type=int, default=20)
+    parser.add_argument('--rest-duration', type=float, default=10)
+    parser.add_argument('--book-ratio', type=float, default=0.3, help='share of REST requests that are bookings')
+    parser.add_argument('--slot-capacity', type=int, default=5)
+    parser.add_argument('--out', help='write JSON results here')
+    parser.add_argument('--compare', help='baseline JSON results to compare against')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        # A few sockets send every request, so admission control would refuse most of them
+        env = {'LINEUP_TOKEN_RATE': '0', 'LINEUP_ADDRESS_TOKEN_RATE': '0',
+               'LINEUP_DEDUPE_TOKENS': '0', 'LINEUP_MAX_QUEUE_LENGTH': '0'}
+        if args.window_ms is not None:
+            env['LINEUP_BROADCAST_WINDOW_MS'] = str(args.window_ms)
+        server = ServerProcess(free_port(), not args.threading, args.inmemory_mongo, env)
+        server.wait_ready()
+        url = server.url
+
+    results = {'config': {k: v for k, v in vars(args).items() if k not in ('out', 'compare')}}
+    try:
+        start = time.perf_counter()
+        results['queue'] = run_queue_phase(args, url)
+        if args.rest:
+            results['rest'] = run_rest_phase(args, url)
+        if server is not None:
+            results['server'] = server.resources(time.perf_counter() - start)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nChanges vs {args.compare}:")
+        compare(baseline, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import threading
+import time
+
+from metrics import Histogram
+from queue_shard import room_for
+
+EMIT_SECONDS = Histogram('lineup_emit_seconds', 'Time to fan an emit out to its recipients', ['event'])
+EMIT_RECIPIENTS = Histogram('lineup_emit_recipients', 'Sockets in this process reached by one emit', ['event'],
+                            buckets=(1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+
+DEFAULT_VIEW_WINDOW = 10
+MAX_VIEW_WINDOW = 50
+
+
+def view_room(professor_id, window):
+    """Socket.IO room for windowed subscribers of a queue with one window size"""
+    return f"{room_for(professor_id)}:top{window}"
+
+
+def room_size(socketio, room, namespace='/'):
+    """Sockets in `room` on this process (all sockets when room is None)"""
+    try:
+        return len(socketio.server.manager.rooms[namespace][room])
+    except (AttributeError, KeyError):
+        return 0
+
+
+def timed_emit(socketio, event, data, to=None, ignore_queue=False):
+    """socketio.emit, recording fan-out duration and recipient count.
+
+    `ignore_queue` delivers to this process's sockets only, skipping the
+    inter-worker message queue.
+    """
+    start = time.perf_counter()
+    socketio.emit(event, data, to=to, ignore_queue=ignore_queue)
+    EMIT_SECONDS.labels(event).observe(time.perf_counter() - start)
+    EMIT_RECIPIENTS.labels(event).observe(room_size(socketio, to))
+
+
+class BroadcastScheduler:
+    """
+    Coalesces queue deltas into one emit per room per tick.
+
+    Handlers call `mark_dirty` with each delta while holding the shard lock,
+    so a room's pending deltas are always in version order. A background task
+    flushes every `window` seconds, sending each dirty room a single
+    `state_deltas` event carrying the list of deltas. A window of 0 disables
+    coalescing and emits every delta inline as `state_delta`.
+    """
+
+    def __init__(self, socketio, window=0.05):
+        self.socketio = socketio
+        self.window = window
+        self._pending = {}  # room -> [delta, ...]
+        self._lock = threading.Lock()
+        self._started = False
+        self.mutations = 0  # Deltas handed to the scheduler
+        self.emits = 0      # Socket.IO emits actually sent
+
+    def mark_dirty(self, room, delta):
+        if self.window <= 0:
+            with self._lock:
+                self.mutations += 1
+                self.emits += 1
+            timed_emit(self.socketio, 'state_delta', delta, to=room)
+            return
+        with self._lock:
+            self.mutations += 1
+            self._pending.setdefault(room, []).append(delta)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        """Send every room's pending deltas as one event"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.emits += len(pending)
+        for room, deltas in pending.items():
+            timed_emit(self.socketio, 'state_deltas', deltas, to=room)
+
+    @property
+    def saved(self):
+        """Emits avoided by coalescing"""
+        return self.mutations - self.emits - self.pending
+
+    @property
+    def pending(self):
+        return sum(len(deltas) for deltas in self._pending.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'window_ms': self.window * 1000,
+                'mutations': self.mutations,
+                'emits': self.emits,
+                'pending': self.pending,
+                'saved_emits': self.saved
+            }
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.window)
+            if self._pending:
+                self.flush()
+
+
+class ViewPublisher:
+    """
+    Pushes windowed queue views to clients that don't want the whole list.
+
+    A windowed subscriber joins a room per (professor, window size) instead
+    of the professor's delta room. Every `interval` seconds, each queue that
+    changed gets one `queue_view` emit per window size in use, carrying the
+    current token, queue length and the first N waiting tokens (left out
+    when those tokens are unchanged since the last view). A subscriber
+    tracking its own token also gets `queue_position`, sent to it alone and
+    only when the position changes.
+
+    With `poll`, every subscribed queue's version is checked each tick, for
+    backends whose queues can be changed by other processes; only queues
+    whose version moved are read. Every worker builds views for its own
+    subscribers, so views and positions are emitted with `ignore_queue`
+    rather than relayed to the other workers. `encode` converts a view
+    to its wire representation just before it is sent. With `eta`, views
+    carry an `eta` list (seconds until each listed token is called) and
+    positions an `eta` of their own; `eta(professor id, queue head,
+    {token id: position})` returns both, see ServiceStats.etas.
+    """
+
+    def __init__(self, socketio, backend, interval=0.05, poll=False, encode=None, eta=None):
+        self.socketio = socketio
+        self.backend = backend
+        self.encode = encode or (lambda view: view)
+        self.eta = eta
+        self.interval = interval
+        self.poll = poll
+        self._subscribers = {}   # sid -> (professor id, window)
+        self._by_professor = {}  # professor id -> {sid, ...}
+        self._tracked = {}       # sid -> token id
+        self._positions = {}     # sid -> last position sent
+        self._versions = {}      # professor id -> version of the last views sent
+        self._heads = {}         # (professor id, window) -> token ids in the last view sent
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, sid, professor_id, window):
+        """Register a windowed subscriber; the caller joins it to view_room()"""
+        with self._lock:
+            previous = self._subscribers.get(sid)
+            if previous is not None and previous[0] != professor_id:
+                self._remove(sid)
+            self._subscribers[sid] = (professor_id, window)
+            self._by_professor.setdefault(professor_id, set()).add(sid)
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._run)
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self._remove(sid)
+
+    def is_subscribed(self, sid):
+        return sid in self._subscribers
+
+    def track(self, sid, token_id):
+        """Send a windowed subscriber the position of `token_id` from now on"""
+        with self._lock:
+            subscription = self._subscribers.get(sid)
+            if subscription is None:
+                return
+            self._tracked[sid] = token_id
+            self._positions.pop(sid, None)
+            self._versions.pop(subscription[0], None)
+            self._dirty.add(subscription[0])
+
+    def mark_dirty(self, professor_id):
+        if professor_id in self._by_professor:
+            with self._lock:
+                self._dirty.add(professor_id)
+
+    def send(self, sid):
+        """Send one subscriber its view (and position) now, e.g. after subscribing"""
+        with self._lock:
+            subscription = self._subscribers.get(sid)
+            token_id = self._tracked.get(sid)
+        if subscription is None:
+            return
+        professor_id, window = subscription
+        view, positions = self.backend.queue_view(professor_id, window, () if token_id is None else (token_id,))
+        etas = self._add_etas(professor_id, view, positions)
+        self.socketio.emit('queue_view', self.encode(view), to=sid, ignore_queue=True)
+        if token_id is not None:
+            self._positions[sid] = positions[token_id]
+            self.socketio.emit('queue_position', self._position(token_id, positions, etas), to=sid,
+                               ignore_queue=True)
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if self.poll:
+                dirty.update(self._by_professor)
+            groups = {}
+            for professor_id in dirty:
+                sids = self._by_professor.get(professor_id)
+                if sids:
+                    groups[professor_id] = [(sid, self._subscribers[sid][1], self._tracked.get(sid)) for sid in sids]
+        for professor_id, members in groups.items():
+            # Cheap version read first: in poll mode most queues haven't moved
+            if self.backend.version(professor_id) == self._versions.get(professor_id):
+                continue
+            windows = {window for _, window, _ in members}
+            token_ids = {token_id for _, _, token_id in members if token_id is not None}
+            view, positions = self.backend.queue_view(professor_id, max(windows), token_ids)
+            if view['version'] == self._versions.get(professor_id):
+                continue
+            self._versions[professor_id] = view['version']
+            etas = self._add_etas(professor_id, view, positions)
+            for window in windows:
+                update = dict(view, queue=view['queue'][:window])
+                if 'eta' in view:
+                    update['eta'] = view['eta'][:window]
+                head = tuple(token['id'] for token in update['queue'])
+                if self._heads.get((professor_id, window)) == head:
+                    del update['queue']
+                else:
+                    self._heads[(professor_id, window)] = head
+                timed_emit(self.socketio, 'queue_view', self.encode(update), to=view_room(professor_id, window),
+                           ignore_queue=True)
+            for sid, _, token_id in members:
+                if token_id is None:
+                    continue
+                position = positions[token_id]
+                if self._positions.get(sid, -1) != position:
+                    self._positions[sid] = position
+                    timed_emit(self.socketio, 'queue_position', self._position(token_id, positions, etas), to=sid,
+                               ignore_queue=True)
+
+    def _add_etas(self, professor_id, view, positions):
+        """Add `eta` to a view; returns the ETA of each token id in `positions`"""
+        if self.eta is None:
+            return {}
+        view['eta'], etas = self.eta(professor_id, view['queue'], positions)
+        return etas
+
+    @staticmethod
+    def _position(token_id, positions, etas):
+        update = {'token_id': token_id, 'position': positions[token_id]}
+        if token_id in etas:
+            update['eta'] = etas[token_id]
+        return update
+
+    def _remove(self, sid):
+        subscription = self._subscribers.pop(sid, None)
+        self._tracked.pop(sid, None)
+        self._positions.pop(sid, None)
+        if subscription is not None:
+            sids = self._by_professor.get(subscription[0])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_professor[subscription[0]]
+                    self._versions.pop(subscription[0], None)
+                    for key in list(self._heads):
+                        if key[0] == subscription[0]:
+                            self._heads.pop(key, None)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            if self._dirty or (self.poll and self._by_professor):
+                self.flush()
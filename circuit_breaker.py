@@ -0,0 +1,65 @@
+"""
+Circuit breaker for calls to a dependency that may be down.
+
+While the dependency answers, the breaker is closed and every call goes
+through. After `failure_threshold` consecutive failures it opens: calls are
+refused at once instead of each waiting for a timeout. Once `reset_timeout`
+seconds have passed, one trial call is let through (half-open); its success
+closes the breaker again, its failure re-opens it for another
+`reset_timeout`.
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=5.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None  # monotonic time the breaker last opened
+        self._trial = False  # a half-open trial call is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return CLOSED
+            if self._trial or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return OPEN
+
+    def allow(self):
+        """Whether a call may go ahead; the first call after `reset_timeout` becomes the trial"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed (0 when closed)"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
@@ -1,36 +1,107 @@
+import logging
 import os
-from pymongo import MongoClient, WriteConcern
-from pymongo.errors import PyMongoError
+from functools import wraps
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError
 from datetime import datetime
 
+from circuit_breaker import CircuitBreaker
+from metrics import Histogram, timed
+
+logger = logging.getLogger('lineup')
+
+MONGO_OPERATION_SECONDS = Histogram('lineup_mongo_operation_seconds', 'db_mongo operation latency', ['operation'])
+
 _client = None
 _db = None
 
+# Opens after consecutive connection failures so callers fail fast while MongoDB is down
+breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('MONGO_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.environ.get('MONGO_BREAKER_RESET_SECONDS', '5'))
+)
+
+class MongoUnavailable(Exception):
+    """MongoDB can't be reached, or the circuit breaker is open. Not a RuntimeError,
+    which callers treat as a booking conflict."""
+
+    def __init__(self, retry_after=0.0):
+        super().__init__('MongoDB unavailable')
+        self.retry_after = retry_after
+
+def guarded(fn):
+    """Run a db operation through the circuit breaker; connection failures raise MongoUnavailable"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not breaker.allow():
+            raise MongoUnavailable(breaker.retry_after())
+        try:
+            result = fn(*args, **kwargs)
+        except ConnectionFailure as e:
+            breaker.record_failure()
+            raise MongoUnavailable(breaker.retry_after()) from e
+        except BaseException:
+            # MongoDB answered (e.g. a duplicate key), or the call failed before reaching it
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+    return wrapper
+
 def get_mongo_uri():
     # Default local replica-set-friendly URI (user can override)
     return os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
 
+def client_options(uri):
+    """
+    Timeouts and pool sizes for MongoClient, from the environment.
+
+    pymongo waits 30 s for a server by default; a short timeout keeps a
+    request from hanging that long while MongoDB is down. Options already
+    set in the URI's query string win.
+    """
+    timeout_ms = int(os.environ.get('MONGO_TIMEOUT_MS', '2000'))
+    options = {
+        'serverSelectionTimeoutMS': timeout_ms,
+        'connectTimeoutMS': timeout_ms,
+        'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000')),
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+        'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    }
+    query = uri.partition('?')[2].lower()
+    return {k: v for k, v in options.items() if k.lower() + '=' not in query}
+
 def connect():
+    """
+    Create the client. This does not wait for MongoDB: pymongo connects in the
+    background and each operation waits at most the server-selection timeout.
+    """
     global _client, _db
     if _client:
         return _db
 
     uri = get_mongo_uri()
-    _client = MongoClient(uri)
+    _client = MongoClient(uri, **client_options(uri))
     _db = _client.get_database(os.environ.get('MONGO_DB', 'lineup'))
-
-    # Ensure indexes
-    _db.timeslots.create_index([('start_ts', 1)])
-    _db.bookings.create_index([('timeslot_id', 1)])
-    _db.bookings.create_index([('status', 1)])
-
     return _db
 
+@guarded
+def ensure_indexes():
+    """Create the timeslot and booking indexes (a no-op for ones that exist)"""
+    db = get_db()
+    # (start_ts, _id) backs keyset pagination; _id breaks ties between equal start times
+    db.timeslots.create_index([('start_ts', 1), ('_id', 1)])
+    # Serves the $lookup in list_timeslots_with_bookings; counting by status is covered by it
+    db.bookings.create_index([('timeslot_id', 1), ('status', 1)])
+    db.bookings.create_index([('status', 1)])
+
 def get_db():
-    if not _db:
+    if _db is None:
         return connect()
     return _db
 
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'create_timeslot')
 def create_timeslot(start_ts, end_ts, capacity=1, label=None):
     db = get_db()
     doc = {
@@ -47,65 +118,203 @@ def create_timeslot(start_ts, end_ts, capacity=1, label=None):
     doc['_id'] = res.inserted_id
     return doc
 
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'create_timeslots')
+def create_timeslots(slots):
+    """
+    Insert many timeslots in one ordered insert_many round trip.
+    `slots` are dicts with start_ts, end_ts, capacity and label.
+    Returns the inserted documents with their _id set.
+    """
+    db = get_db()
+    now = datetime.utcnow()
+    docs = [{
+        'start_ts': slot['start_ts'],
+        'end_ts': slot['end_ts'],
+        'capacity': int(slot.get('capacity', 1)),
+        'label': slot.get('label'),
+        'booked_count': 0,
+        'is_active': True,
+        'created_at': now,
+        'updated_at': now
+    } for slot in slots]
+    if docs:
+        # insert_many sets each doc's _id in place
+        db.timeslots.insert_many(docs, ordered=True)
+    return docs
+
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'find_timeslots_overlapping')
+def find_timeslots_overlapping(start_ts, end_ts):
+    """Active timeslots that overlap [start_ts, end_ts)"""
+    db = get_db()
+    return list(db.timeslots.find(
+        {'is_active': True, 'start_ts': {'$lt': end_ts}, 'end_ts': {'$gt': start_ts}},
+        {'start_ts': 1, 'end_ts': 1, 'label': 1}
+    ))
+
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'list_timeslots')
 def list_timeslots(filter_query=None):
     db = get_db()
     q = filter_query or {'is_active': True}
     docs = list(db.timeslots.find(q))
     return docs
 
+TIMESLOT_FIELDS = ('start_ts', 'end_ts', 'capacity', 'label', 'booked_count', 'is_active', 'created_at', 'updated_at')
+
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'list_timeslots_page')
+def list_timeslots_page(start_from=None, start_to=None, limit=100, after=None, fields=None):
+    """
+    One page of active timeslots ordered by (start_ts, _id).
+
+    Uses keyset pagination: `after` is the (start_ts, _id) of the last slot on
+    the previous page, so every page is an index range scan regardless of how
+    deep the client has paged. `fields` limits the returned fields (start_ts
+    and _id are always fetched since the next key is built from them).
+    Returns (docs, next_after); next_after is None on the last page.
+    """
+    db = get_db()
+    projection = None
+    if fields is not None:
+        projection = {f: 1 for f in fields}
+        projection['start_ts'] = 1
+
+    # Fetch one extra document to learn whether another page exists
+    cursor = db.timeslots.find(page_query(start_from, start_to, after), projection) \
+        .sort([('start_ts', 1), ('_id', 1)]) \
+        .limit(limit + 1)
+    return split_page(list(cursor), limit)
+
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'list_timeslots_with_bookings')
+def list_timeslots_with_bookings(start_from=None, start_to=None, limit=100, after=None, counts_only=False):
+    """
+    One page of active timeslots, as list_timeslots_page, each with its
+    bookings joined in by the same aggregation: a `bookings` list (oldest
+    first, without timeslot_id) or, with `counts_only`, a `booking_counts`
+    dict of {status: count}.
+
+    The page is cut before the $lookup, so only its slots are joined. The
+    lookup matches bookings on the (timeslot_id, status) index; counts are
+    grouped straight from the index without reading booking documents.
+    Needs MongoDB 5.0+ for $lookup with both localField and a pipeline.
+    """
+    db = get_db()
+    if counts_only:
+        joined, lookup = 'booking_counts', [{'$group': {'_id': '$status', 'n': {'$sum': 1}}}]
+    else:
+        joined, lookup = 'bookings', [{'$sort': {'created_at': 1}}, {'$project': {'timeslot_id': 0}}]
+    pipeline = [
+        {'$match': page_query(start_from, start_to, after)},
+        {'$sort': {'start_ts': 1, '_id': 1}},
+        # Fetch one extra document to learn whether another page exists
+        {'$limit': limit + 1},
+        {'$lookup': {'from': 'bookings', 'localField': '_id', 'foreignField': 'timeslot_id',
+                     'pipeline': lookup, 'as': joined}},
+    ]
+    if counts_only:
+        # [{_id: status, n: count}, ...] -> {status: count}
+        pipeline.append({'$addFields': {joined: {'$arrayToObject': {'$map': {
+            'input': '$' + joined,
+            'in': {'k': {'$ifNull': ['$$this._id', 'unknown']}, 'v': '$$this.n'}
+        }}}}})
+    return split_page(list(db.timeslots.aggregate(pipeline)), limit)
+
+def page_query(start_from=None, start_to=None, after=None):
+    """Filter for active timeslots in [start_from, start_to) after the (start_ts, _id) key `after`"""
+    clauses = [{'is_active': True}]
+    start_range = {}
+    if start_from is not None:
+        start_range['$gte'] = start_from
+    if start_to is not None:
+        start_range['$lt'] = start_to
+    if start_range:
+        clauses.append({'start_ts': start_range})
+    if after is not None:
+        after_ts, after_id = after
+        clauses.append({'$or': [
+            {'start_ts': {'$gt': after_ts}},
+            {'start_ts': after_ts, '_id': {'$gt': after_id}}
+        ]})
+    return {'$and': clauses}
+
+def split_page(docs, limit):
+    """(docs, next_after) from up to limit + 1 documents ordered by (start_ts, _id)"""
+    next_after = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_after = (docs[-1]['start_ts'], docs[-1]['_id'])
+    return docs, next_after
+
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'get_timeslot')
 def get_timeslot(timeslot_id):
     from bson import ObjectId
     db = get_db()
     return db.timeslots.find_one({'_id': ObjectId(timeslot_id)})
 
+@guarded
+@timed(MONGO_OPERATION_SECONDS, 'book_timeslot')
 def book_timeslot(timeslot_id, name, contact=None):
     """
-    Attempt to create a booking for given timeslot_id.
-    Uses transactions when available (replica set). Returns booking doc on success.
-    Raises RuntimeError on full or PyMongoError on DB issues.
+    Attempt to create a booking for given timeslot_id. Returns booking doc on success.
+    Raises RuntimeError on full, MongoUnavailable if MongoDB can't be reached
+    or PyMongoError on other DB issues.
+
+    Capacity is reserved with a single conditional update (booked_count <
+    capacity), which MongoDB applies atomically to the one timeslot document,
+    so concurrent bookers can never oversell and no transaction (or replica
+    set) is needed. If the booking insert then fails and the booking is
+    confirmed absent, the reservation is released again; if its absence can't
+    be confirmed, the seat stays taken rather than risk overselling.
     """
     from bson import ObjectId
+    from bson.errors import InvalidId
     db = get_db()
-    client = _client
+    try:
+        oid = ObjectId(timeslot_id)
+    except InvalidId:
+        raise RuntimeError('Timeslot not found or inactive')
+
+    reserved = db.timeslots.update_one(
+        {'_id': oid, 'is_active': {'$ne': False}, '$expr': {'$lt': ['$booked_count', '$capacity']}},
+        {'$inc': {'booked_count': 1}, '$set': {'updated_at': datetime.utcnow()}}
+    )
+    if reserved.modified_count == 0:
+        ts = db.timeslots.find_one({'_id': oid}, {'is_active': 1})
+        if not ts or not ts.get('is_active', True):
+            raise RuntimeError('Timeslot not found or inactive')
+        raise RuntimeError('Timeslot full')
 
-    # Use session/transaction if available (requires replica set)
+    booking = {
+        # Client-side id, so a failed insert can be checked for before compensating
+        '_id': ObjectId(),
+        'timeslot_id': oid,
+        'name': name,
+        'contact': contact,
+        'status': 'booked',
+        'created_at': datetime.utcnow(),
+    }
     try:
-        if client is not None and client.start_session:
-            with client.start_session() as session:
-                with session.start_transaction(write_concern=WriteConcern(w='majority')):
-                    ts = db.timeslots.find_one({'_id': ObjectId(timeslot_id)}, session=session)
-                    if not ts or not ts.get('is_active', True):
-                        raise RuntimeError('Timeslot not found or inactive')
-                    if ts.get('booked_count', 0) >= ts.get('capacity', 1):
-                        raise RuntimeError('Timeslot full')
-                    booking = {
-                        'timeslot_id': ObjectId(timeslot_id),
-                        'name': name,
-                        'contact': contact,
-                        'status': 'booked',
-                        'created_at': datetime.utcnow(),
-                    }
-                    res = db.bookings.insert_one(booking, session=session)
-                    db.timeslots.update_one({'_id': ObjectId(timeslot_id)}, {'$inc': {'booked_count': 1}, '$set': {'updated_at': datetime.utcnow()}}, session=session)
-                    booking['_id'] = res.inserted_id
-                    return booking
-        else:
-            # Fallback non-transactional (possible race conditions on heavy concurrency)
-            ts = db.timeslots.find_one({'_id': ObjectId(timeslot_id)})
-            if not ts or not ts.get('is_active', True):
-                raise RuntimeError('Timeslot not found or inactive')
-            if ts.get('booked_count', 0) >= ts.get('capacity', 1):
-                raise RuntimeError('Timeslot full')
-            booking = {
-                'timeslot_id': ObjectId(timeslot_id),
-                'name': name,
-                'contact': contact,
-                'status': 'booked',
-                'created_at': datetime.utcnow(),
-            }
-            res = db.bookings.insert_one(booking)
-            db.timeslots.update_one({'_id': ObjectId(timeslot_id)}, {'$inc': {'booked_count': 1}, '$set': {'updated_at': datetime.utcnow()}})
-            booking['_id'] = res.inserted_id
+        db.bookings.insert_one(booking)
+    except PyMongoError as error:
+        # The insert may have landed even though the acknowledgement was lost;
+        # only give the reserved seat back if the booking really isn't there.
+        # If that can't be checked, keep the seat: a lost seat beats an oversold slot.
+        try:
+            landed = db.bookings.find_one({'_id': booking['_id']}, {'_id': 1}) is not None
+        except PyMongoError:
+            logger.warning("Booking %s for timeslot %s may not have been stored; its seat stays reserved",
+                           booking['_id'], oid)
+            raise error
+        if landed:
             return booking
-    except PyMongoError as e:
-        raise
+        try:
+            db.timeslots.update_one({'_id': oid},
+                                    {'$inc': {'booked_count': -1}, '$set': {'updated_at': datetime.utcnow()}})
+        except PyMongoError:
+            logger.warning("Could not release the seat of failed booking %s for timeslot %s", booking['_id'], oid)
+        raise error
+    return booking
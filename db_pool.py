@@ -0,0 +1,106 @@
+"""
+Bounded worker pool for blocking MongoDB calls made by REST routes.
+
+Timeslot routes hand their db_mongo calls to a DbPool instead of running
+them on the threads that also serve Socket.IO, so a slow database holds up
+pool workers rather than queue traffic. The pool gives backpressure in two
+places:
+
+- At most `max_workers` calls run at once and `max_pending` more may wait.
+  Past that, `run` raises PoolSaturated straight away.
+- A caller waits at most `timeout` seconds for its result (PoolTimeout).
+  The call itself still finishes on its worker.
+
+Work that must follow a completed call, such as invalidating caches and
+emitting `booking_update`, is passed as `then`. It runs on the worker once
+the call succeeds, so it happens exactly once, even if the caller has
+already given up waiting.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from metrics import Counter
+
+DB_POOL_REJECTIONS = Counter('lineup_db_pool_rejections_total', 'Database calls refused by the worker pool',
+                             ['reason'])
+
+logger = logging.getLogger('lineup')
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class PoolTimeout(Exception):
+    """The call did not finish within the pool's timeout; it may still complete"""
+
+
+class DbPool:
+    def __init__(self, max_workers=8, max_pending=32, timeout=5.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='lineup-db')
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        """Calls running or waiting for a worker"""
+        return self._in_flight
+
+    def run(self, fn, *args, then=None, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool and return its result; `then(result)` follows on the worker"""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                DB_POOL_REJECTIONS.labels('saturated').inc()
+                raise PoolSaturated()
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(self._call, fn, args, kwargs, then)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            DB_POOL_REJECTIONS.labels('timeout').inc()
+            raise PoolTimeout() from None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+    def _call(self, fn, args, kwargs, then):
+        try:
+            result = fn(*args, **kwargs)
+            if then is not None:
+                try:
+                    then(result)
+                except Exception:
+                    # The write itself succeeded; don't report it as failed
+                    logger.exception("Follow-up to %s failed", fn.__name__)
+            return result
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
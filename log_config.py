@@ -0,0 +1,60 @@
+import logging
+import os
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per second for each message template,
+    with bursts of up to `burst`. When a template is let through again, the
+    record notes how many were suppressed in between. The check is O(1) per
+    record.
+    """
+
+    def __init__(self, rate=5.0, burst=20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # (logger, template) -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def configure_logging():
+    """
+    Set up the 'lineup' logger from the environment:
+
+    LINEUP_LOG_LEVEL      DEBUG, INFO (default), WARNING, ERROR or OFF
+    LINEUP_LOG_RATE       records per second per message before suppression (default 5)
+    """
+    logger = logging.getLogger('lineup')
+    level = os.environ.get('LINEUP_LOG_LEVEL', 'INFO').upper()
+    if level == 'OFF':
+        logger.disabled = True
+        return logger
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handler.addFilter(RateLimitFilter(rate=float(os.environ.get('LINEUP_LOG_RATE', '5'))))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,47 @@
+import socketio
+from pymongo import CursorType
+
+
+class MongoManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that relays emits between server processes
+    through a capped MongoDB collection.
+
+    Every process inserts its outgoing messages into the collection and
+    follows it with a tailable cursor, so an emit to a room reaches that
+    room's sockets on every worker. Messages are stored as plain BSON
+    documents, not pickles, so write access to the collection can't be
+    turned into code execution.
+
+    :param db: pymongo Database to use, e.g. the one from `db_mongo.connect()`
+    :param channel: name of the capped collection (prefixed with `pubsub_`)
+    :param size: capped collection size in bytes
+    """
+    name = 'mongo'
+
+    def __init__(self, db, channel='socketio', size=16 * 1024 * 1024, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        name = f"pubsub_{channel}"
+        if name not in db.list_collection_names():
+            db.create_collection(name, capped=True, size=size)
+            # Tailable cursors die straight away on an empty collection
+            db[name].insert_one({'msg': None})
+        self.collection = db[name]
+
+    def _publish(self, data):
+        self.collection.insert_one({'msg': data})
+
+    def _listen(self):
+        # Only relay messages published after this process started
+        last = self.collection.find_one(sort=[('$natural', -1)])
+        last_id = last['_id'] if last else None
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                for doc in cursor:
+                    last_id = doc['_id']
+                    if doc['msg'] is not None:
+                        yield doc['msg']
+            # The cursor dies if the collection wraps past it; reopen after a pause
+            self.server.sleep(0.1)
@@ -4,28 +4,65 @@ import socketio
 import pystray
 from PIL import Image, ImageDraw
 import threading
+import json
 import sys
+import os
+from queue import Empty, SimpleQueue
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from wire_format import unpack_delta, unpack_state
+
+UI_POLL_MS = 50  # How often the Tk main loop applies updates from the socket thread
+
+def id_index(items, token_id, key=lambda item: item):
+    """Index at which `token_id` belongs in `items`, kept in increasing id order.
+    Scans back from the end, where new ids almost always go."""
+    index = len(items)
+    while index and key(items[index - 1]) > token_id:
+        index -= 1
+    return index
 
 class ProfessorApp:
-    def __init__(self):
+    def __init__(self, professor_id=None, window=None):
+        # Queue this app controls; the server keeps one queue per professor id
+        self.professor_id = professor_id or os.environ.get('LINEUP_PROFESSOR_ID', 'default')
+        # With a window size, only the first `window` tokens and the queue length are sent
+        window = window or os.environ.get('LINEUP_QUEUE_WINDOW')
+        self.window = int(window) if window else None
+        
         self.root = tk.Tk()
-        self.root.title("LineUp - Professor Control")
+        self.root.title(f"LineUp - Professor Control ({self.professor_id})")
         self.root.geometry("400x550")
         self.root.resizable(False, False)
         
-        # SocketIO client
+        # SocketIO client. Its handlers run on a background thread, so they only
+        # post (kind, payload) events here; the Tk main loop applies them.
+        # Replaced by a msgpack client if the server uses that wire format.
+        self.server = 'http://localhost:5000'
+        self.compact = False
         self.sio = socketio.Client()
+        self.ui_events = SimpleQueue()
         self.setup_socketio()
         
         # State
         self.state = {
             'professor_status': 'Unavailable',
             'current_token': None,
-            'queue': []
+            'queue': [],
+            'version': None  # None until the first snapshot arrives
         }
+        # Set while a get_state is outstanding: deltas are dropped until the snapshot arrives
+        self.resync_pending = False
+        
+        # Listbox bookkeeping: token id of each row, and changes not yet drawn
+        self.row_ids = []
+        self.row_changes = []  # ('add', token) / ('remove', token id), in order
+        self.rebuild_rows = True
         
         # UI Setup
         self.setup_ui()
+        self.root.after(UI_POLL_MS, self.drain_ui_events)
         
         # System tray
         self.tray_icon = None
@@ -47,19 +84,156 @@ class ProfessorApp:
         """Setup SocketIO event handlers"""
         @self.sio.on('connect')
         def on_connect():
+            # The server sends a snapshot (or `state_current`) on connect
             print("Connected to server")
-            self.sio.emit('get_state')
-            self.update_connection_status(True)
+            self.ui_events.put(('connected', True))
         
         @self.sio.on('disconnect')
         def on_disconnect():
             print("Disconnected from server")
-            self.update_connection_status(False)
+            self.ui_events.put(('connected', False))
         
         @self.sio.on('state_update')
         def on_state_update(data):
-            self.state = data
+            self.ui_events.put(('snapshot', unpack_state(data) if self.compact else data))
+        
+        @self.sio.on('state_delta')
+        def on_state_delta(delta):
+            self.ui_events.put(('delta', unpack_delta(delta) if self.compact else delta))
+        
+        @self.sio.on('state_deltas')
+        def on_state_deltas(deltas):
+            for delta in deltas:
+                self.ui_events.put(('delta', unpack_delta(delta) if self.compact else delta))
+        
+        @self.sio.on('queue_view')
+        def on_queue_view(view):
+            self.ui_events.put(('view', unpack_state(view) if self.compact else view))
+    
+    def negotiate_wire_format(self):
+        """Match the server's wire format (GET /api/wire-format) before connecting"""
+        try:
+            with urlopen(f'{self.server}/api/wire-format', timeout=5) as response:
+                wire = json.load(response)
+        except (OSError, ValueError):
+            return  # Older server without the endpoint: plain JSON
+        if wire.get('format') == 'msgpack' and not self.compact:
+            # Positional tokens, decoded by unpack_state/unpack_delta
+            self.sio = socketio.Client(serializer='msgpack')
+            self.compact = True
+            self.setup_socketio()
+    
+    def drain_ui_events(self):
+        """Apply every update posted since the last tick, then redraw once (Tk thread)"""
+        changed = False
+        while True:
+            try:
+                kind, payload = self.ui_events.get_nowait()
+            except Empty:
+                break
+            if kind == 'connected':
+                # The connect handshake resyncs; a get_state sent before a drop may go unanswered
+                self.resync_pending = False
+                if not payload and self.window:
+                    # A restarted server without LINEUP_DATA_DIR counts versions from 0 again
+                    self.state['version'] = None
+                self.update_connection_status(payload)
+            elif kind == 'snapshot':
+                self.resync_pending = False
+                self.state = payload
+                self.rebuild_rows = True
+                changed = True
+            elif kind == 'view':
+                changed = self.apply_view(payload) or changed
+            elif kind == 'delta':
+                changed = self.apply_delta(payload) or changed
+        if changed:
             self.update_ui()
+        self.root.after(UI_POLL_MS, self.drain_ui_events)
+    
+    def apply_view(self, view):
+        """Apply a windowed `queue_view`: the head of the queue plus its length"""
+        version = self.state.get('version')
+        # Versions are per queue: after select_queue, the new queue's first view replaces the old one's
+        same_queue = view.get('professor_id') == self.state.get('professor_id')
+        if version is not None and same_queue and view['version'] < version:
+            return False
+        if 'queue' in view:
+            self.rebuild_rows = True
+        else:
+            # Left out when the head of the queue is unchanged
+            view['queue'] = self.state.get('queue', [])
+        self.state = view
+        return True
+    
+    def subscription(self):
+        """Subscription options for the server: queue, plus the windowed view if configured"""
+        options = {'professor': self.professor_id}
+        if self.window:
+            options.update(view='window', window=self.window)
+        return options
+    
+    def server_url(self):
+        """Connection URL, rebuilt on every reconnect so it carries the last-seen version"""
+        options = self.subscription()
+        version = self.state.get('version')
+        if version is not None and not self.window:
+            # Lets the server answer `state_current` instead of resending an unchanged snapshot
+            options['version'] = version
+        return f'{self.server}?{urlencode(options)}'
+    
+    def apply_delta(self, delta):
+        """Apply a versioned delta, or resync with a snapshot on a version gap.
+        Returns True if the state changed."""
+        version = self.state.get('version')
+        if version is None or self.resync_pending or delta['version'] <= version:
+            return False
+        if delta['version'] != version + 1:
+            self.request_state()
+            return False
+        
+        kind = delta['type']
+        if kind == 'token_added':
+            token = delta['token']
+            queue = self.state['queue']
+            # With several workers, ids can be added out of order and a snapshot
+            # from the shared backend can already include this token: insert by
+            # id, skipping duplicates. New ids are nearly always the largest.
+            index = id_index(queue, token['id'], lambda t: t['id'])
+            if index == 0 or queue[index - 1]['id'] != token['id']:
+                queue.insert(index, token)
+                self.row_changes.append(('add', token))
+        elif kind == 'token_served':
+            token = delta['token']
+            self.state['current_token'] = token
+            if token:
+                self.remove_queued(token['id'])
+        elif kind == 'token_removed':
+            self.remove_queued(delta['id'])
+        elif kind == 'current_cleared':
+            self.state['current_token'] = None
+        elif kind == 'status_changed':
+            self.state['professor_status'] = delta['status']
+        else:
+            self.request_state()
+            return False
+        self.state['version'] = delta['version']
+        return True
+    
+    def request_state(self):
+        """Ask for a snapshot, once: later deltas are dropped until it arrives"""
+        if not self.resync_pending:
+            self.resync_pending = True
+            self.sio.emit('get_state')
+    
+    def remove_queued(self, token_id):
+        """Drop a token from the local queue; served tokens are at the head, so this is usually O(1)"""
+        queue = self.state['queue']
+        for i, token in enumerate(queue):
+            if token['id'] == token_id:
+                del queue[i]
+                self.row_changes.append(('remove', token_id))
+                return
     
     def setup_ui(self):
         """Create the UI"""
@@ -146,7 +320,11 @@ class ProfessorApp:
         """Connect to the server in a separate thread"""
         def connect():
             try:
-                self.sio.connect('http://localhost:5000', 
+                self.negotiate_wire_format()
+                # The key lets the server treat this app as the professor (e.g. to cancel any token)
+                key = os.environ.get('LINEUP_PROFESSOR_KEY')
+                self.sio.connect(self.server_url, 
+                               auth={'professor_key': key} if key else None,
                                wait_timeout=10,
                                transports=['websocket', 'polling'])
                 print("Successfully connected to server!")
@@ -159,6 +337,17 @@ class ProfessorApp:
         thread = threading.Thread(target=connect, daemon=True)
         thread.start()
     
+    def select_queue(self, professor_id):
+        """Switch the queue this app controls"""
+        self.professor_id = professor_id
+        self.root.title(f"LineUp - Professor Control ({professor_id})")
+        # Ignore deltas until the new queue's snapshot arrives
+        self.state['version'] = None
+        if self.sio.connected:
+            options = self.subscription()
+            options['professor_id'] = options.pop('professor')
+            self.sio.emit('join_queue', options)
+    
     def update_connection_status(self, connected):
         """Update connection status label"""
         if connected:
@@ -208,12 +397,29 @@ class ProfessorApp:
         
         # Update queue
         queue = self.state.get('queue', [])
-        self.queue_label.config(text=f"Total: {len(queue)}")
-        
-        self.queue_listbox.delete(0, tk.END)
-        for token in queue:
-            self.queue_listbox.insert(tk.END, 
-                f"#{token['id']} - {token['name']} ({token['type']})")
+        self.queue_label.config(text=f"Total: {self.state.get('queue_length', len(queue))}")
+        
+        if self.rebuild_rows:
+            # After a snapshot or a new windowed head: redraw every row
+            self.queue_listbox.delete(0, tk.END)
+            self.queue_listbox.insert(tk.END, *(self.format_row(token) for token in queue))
+            self.row_ids = [token['id'] for token in queue]
+            self.rebuild_rows = False
+        else:
+            # Otherwise patch only the rows that changed
+            for change, value in self.row_changes:
+                if change == 'add':
+                    index = id_index(self.row_ids, value['id'])
+                    self.queue_listbox.insert(index, self.format_row(value))
+                    self.row_ids.insert(index, value['id'])
+                else:
+                    index = self.row_ids.index(value)
+                    self.queue_listbox.delete(index)
+                    del self.row_ids[index]
+        self.row_changes.clear()
+    
+    def format_row(self, token):
+        return f"#{token['id']} - {token['name']} ({token['type']})"
     
     def create_tray_icon(self):
         """Create system tray icon"""
@@ -300,5 +506,6 @@ class ProfessorApp:
         self.root.mainloop()
 
 if __name__ == "__main__":
-    app = ProfessorApp()
+    app = ProfessorApp(sys.argv[1] if len(sys.argv) > 1 else None,
+                       sys.argv[2] if len(sys.argv) > 2 else None)
     app.run()
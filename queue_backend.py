@@ -0,0 +1,254 @@
+"""
+Pluggable queue-state backends.
+
+Both backends expose the same operations keyed by professor id. Each
+mutation returns the versioned delta it produced (or None, e.g. when
+`add_token` finds the queue at `max_length`) and hands it to
+the `publish` callback before releasing the professor's lock, so deltas from
+one process are published in version order.
+
+- InProcessBackend keeps every queue in this process's memory (the default).
+- MongoBackend keeps queues in MongoDB so several server processes can share
+  them. Token ids and versions come from atomic `$inc` counters. Deltas from
+  different processes can reach a client out of order. The client sees a
+  version gap and resyncs from a snapshot.
+"""
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, ReturnDocument
+
+from queue_shard import STATUSES, ShardRegistry
+
+# A queue nobody has changed yet. Reads answer with it instead of creating
+# the shard document, so unknown professor ids from clients leave no trace.
+EMPTY_SHARD = {
+    'professor_status': 'Unavailable',
+    'current_token': None,
+    'token_counter': 1,
+    'queue_length': 0,
+    'version': 0
+}
+
+
+class InProcessBackend:
+    name = 'memory'
+
+    def __init__(self, publish):
+        self.publish = publish
+        self.shards = ShardRegistry()
+
+    def queue_depths(self):
+        """Waiting tokens per professor id"""
+        return {shard.professor_id: len(shard.queue) for shard in self.shards}
+
+    def version(self, professor_id):
+        """Current version of a queue, without copying its state"""
+        return self.shards.find(professor_id).version
+
+    def snapshot(self, professor_id):
+        shard = self.shards.find(professor_id)
+        with shard.lock:
+            return shard.snapshot()
+
+    def queue_view(self, professor_id, limit, token_ids=()):
+        """(view dict, {token id: position}) for windowed subscribers"""
+        shard = self.shards.find(professor_id)
+        with shard.lock:
+            return shard.view(limit), {tid: shard.position(tid) for tid in token_ids}
+
+    def is_queued(self, professor_id, token_id):
+        return token_id in self.shards.find(professor_id).queue
+
+    def add_token(self, professor_id, name, type, max_length=None):
+        return self._mutate(professor_id, 'add_token', name, type, max_length)
+
+    def set_status(self, professor_id, status):
+        return self._mutate(professor_id, 'set_status', status)
+
+    def serve_next(self, professor_id):
+        return self._mutate(professor_id, 'serve_next')
+
+    def cancel_token(self, professor_id, token_id):
+        return self._mutate(professor_id, 'cancel_token', token_id)
+
+    def clear_current(self, professor_id):
+        return self._mutate(professor_id, 'clear_current')
+
+    def _mutate(self, professor_id, method, *args):
+        shard = self.shards.get(professor_id)
+        with shard.lock:
+            delta = getattr(shard, method)(*args)
+            if delta is not None:
+                self.publish(professor_id, delta)
+        return delta
+
+
+class MongoBackend:
+    """
+    Queues stored in two collections:
+
+    - queue_shards: one document per professor with status, current token,
+      token_counter, queue_length and version
+    - queue_tokens: one document per waiting token, ordered by token id
+
+    Shard documents are created by the first mutation; reads of a queue
+    without one see EMPTY_SHARD.
+    """
+    name = 'mongo'
+
+    def __init__(self, db, publish):
+        self.db = db
+        self.publish = publish
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._known = set()  # Professor ids whose shard document exists
+        db.queue_tokens.create_index([('professor_id', ASCENDING), ('id', ASCENDING)], unique=True)
+
+    def queue_depths(self):
+        """Waiting tokens per professor id"""
+        return {doc['_id']: doc['n'] for doc in self.db.queue_tokens.aggregate([
+            {'$group': {'_id': '$professor_id', 'n': {'$sum': 1}}}
+        ])}
+
+    def version(self, professor_id):
+        """Current version of a queue, without reading its tokens"""
+        shard = self.db.queue_shards.find_one({'_id': professor_id}, {'version': 1})
+        return shard['version'] if shard is not None else 0
+
+    def snapshot(self, professor_id):
+        # Read the shard before the tokens: the token list can then only be
+        # ahead of the version, and clients skip token ids they already have
+        shard = self._find(professor_id)
+        queue = list(self.db.queue_tokens.find(
+            {'professor_id': professor_id},
+            {'_id': 0, 'professor_id': 0}
+        ).sort('id', ASCENDING))
+        return {
+            'professor_id': professor_id,
+            'professor_status': shard['professor_status'],
+            'current_token': shard['current_token'],
+            'queue': queue,
+            'token_counter': shard['token_counter'],
+            'version': shard['version']
+        }
+
+    def queue_view(self, professor_id, limit, token_ids=()):
+        """(view dict, {token id: position}) for windowed subscribers"""
+        shard = self._find(professor_id)
+        tokens = self.db.queue_tokens
+        queue = list(tokens.find(
+            {'professor_id': professor_id},
+            {'_id': 0, 'professor_id': 0}
+        ).sort('id', ASCENDING).limit(limit))
+        view = {
+            'professor_id': professor_id,
+            'professor_status': shard['professor_status'],
+            'current_token': shard['current_token'],
+            'queue_length': tokens.count_documents({'professor_id': professor_id}),
+            'queue': queue,
+            'version': shard['version']
+        }
+        current = shard['current_token']
+        positions = {}
+        for tid in token_ids:
+            if current is not None and current['id'] == tid:
+                positions[tid] = 0
+            elif tokens.count_documents({'professor_id': professor_id, 'id': tid}, limit=1):
+                # Token ids increase in arrival order, so the position is the count up to it
+                positions[tid] = tokens.count_documents({'professor_id': professor_id, 'id': {'$lte': tid}})
+            else:
+                positions[tid] = None
+        return view, positions
+
+    def is_queued(self, professor_id, token_id):
+        return self.db.queue_tokens.find_one({'professor_id': professor_id, 'id': token_id}, {'_id': 1}) is not None
+
+    def add_token(self, professor_id, name, type, max_length=None):
+        with self._lock(professor_id):
+            # queue_length is a counter on the shard, so the limit check is one
+            # conditional update rather than a count of the queue's tokens
+            match = {'queue_length': {'$lt': max_length}} if max_length else None
+            doc = self._update(professor_id, {'$inc': {'token_counter': 1, 'queue_length': 1}}, match)
+            if doc is None:
+                return None
+            token = {
+                'id': doc['token_counter'] - 1,
+                'name': name,
+                'type': type,
+                'timestamp': datetime.now().strftime('%H:%M:%S')
+            }
+            self.db.queue_tokens.insert_one(dict(token, professor_id=professor_id))
+            # Bump the version only once the token is visible to snapshots
+            doc = self._update(professor_id, {'$inc': {'version': 1}})
+            return self._publish(professor_id, doc, 'token_added', token=token)
+
+    def set_status(self, professor_id, status):
+        if status not in STATUSES:
+            return None
+        with self._lock(professor_id):
+            doc = self._update(professor_id, {'$set': {'professor_status': status}, '$inc': {'version': 1}})
+            return self._publish(professor_id, doc, 'status_changed', status=status)
+
+    def serve_next(self, professor_id):
+        with self._lock(professor_id):
+            token = self.db.queue_tokens.find_one_and_delete(
+                {'professor_id': professor_id},
+                projection={'_id': 0, 'professor_id': 0},
+                sort=[('id', ASCENDING)]
+            )
+            update = {'$set': {'current_token': token}, '$inc': {'version': 1}}
+            if token is not None:
+                update['$inc']['queue_length'] = -1
+            doc = self._update(professor_id, update)
+            return self._publish(professor_id, doc, 'token_served', token=token)
+
+    def cancel_token(self, professor_id, token_id):
+        with self._lock(professor_id):
+            token = self.db.queue_tokens.find_one_and_delete({'professor_id': professor_id, 'id': token_id})
+            if token is None:
+                return None
+            doc = self._update(professor_id, {'$inc': {'version': 1, 'queue_length': -1}})
+            return self._publish(professor_id, doc, 'token_removed', id=token_id)
+
+    def clear_current(self, professor_id):
+        with self._lock(professor_id):
+            doc = self._update(professor_id, {'$set': {'current_token': None}, '$inc': {'version': 1}})
+            return self._publish(professor_id, doc, 'current_cleared')
+
+    def _publish(self, professor_id, doc, delta_type, **payload):
+        delta = {'version': doc['version'], 'type': delta_type}
+        delta.update(payload)
+        self.publish(professor_id, delta)
+        return delta
+
+    def _update(self, professor_id, update, match=None):
+        """Apply `update` to the shard document; None if `match` didn't hold"""
+        self._ensure(professor_id)
+        query = {'_id': professor_id}
+        if match:
+            query.update(match)
+        return self.db.queue_shards.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER
+        )
+
+    def _find(self, professor_id):
+        return self.db.queue_shards.find_one({'_id': professor_id}) or EMPTY_SHARD
+
+    def _ensure(self, professor_id):
+        if professor_id in self._known:
+            return
+        self.db.queue_shards.update_one({'_id': professor_id}, {'$setOnInsert': EMPTY_SHARD}, upsert=True)
+        # Shards created before queue_length existed get it counted once
+        self.db.queue_shards.update_one(
+            {'_id': professor_id, 'queue_length': {'$exists': False}},
+            {'$set': {'queue_length': self.db.queue_tokens.count_documents({'professor_id': professor_id})}}
+        )
+        self._known.add(professor_id)
+
+    def _lock(self, professor_id):
+        lock = self._locks.get(professor_id)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._locks.setdefault(professor_id, threading.Lock())
+        return lock
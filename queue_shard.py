@@ -0,0 +1,167 @@
+import threading
+from datetime import datetime
+from itertools import islice
+
+from token_queue import Token, TokenQueue
+
+DEFAULT_PROFESSOR_ID = 'default'
+STATUSES = ['Available', 'Busy', 'In Cabin', 'Unavailable']
+
+
+def room_for(professor_id):
+    """Socket.IO room that subscribers of a professor's queue join"""
+    return f"professor:{professor_id}"
+
+
+class QueueShard:
+    """
+    Queue state for a single professor.
+
+    Each shard has its own lock, so traffic for one professor never waits on
+    another. Mutators must be called with `lock` held. They return the
+    versioned delta to broadcast to the shard's room, or None if nothing
+    changed.
+    """
+
+    def __init__(self, professor_id):
+        self.professor_id = professor_id
+        self.lock = threading.Lock()
+        self.professor_status = 'Unavailable'
+        self.current_token = None  # Token being served, or None
+        self.queue = TokenQueue()
+        self.token_counter = 1
+        self.version = 0  # Bumped on every mutation; clients use it to detect missed deltas
+
+    def snapshot(self):
+        """JSON-serialisable copy of the shard for full-state sends"""
+        current = self.current_token
+        return {
+            'professor_id': self.professor_id,
+            'professor_status': self.professor_status,
+            'current_token': current.to_dict() if current else None,
+            'queue': self.queue.to_list(),
+            'token_counter': self.token_counter,
+            'version': self.version
+        }
+
+    def view(self, limit):
+        """Current token, queue length and the first `limit` waiting tokens"""
+        current = self.current_token
+        return {
+            'professor_id': self.professor_id,
+            'professor_status': self.professor_status,
+            'current_token': current.to_dict() if current else None,
+            'queue_length': len(self.queue),
+            'queue': [token.to_dict() for token in islice(self.queue, limit)],
+            'version': self.version
+        }
+
+    def position(self, token_id):
+        """1-based queue position of a token, 0 while it is being served, None otherwise"""
+        current = self.current_token
+        if current is not None and current.id == token_id:
+            return 0
+        return self.queue.position(token_id)
+
+    def restore(self, snap):
+        """Replace the shard's contents with a `snapshot()` dict"""
+        current = snap['current_token']
+        self.professor_status = snap['professor_status']
+        self.current_token = Token(**current) if current else None
+        self.queue = TokenQueue()
+        for token in snap['queue']:
+            self.queue.append(Token(**token))
+        self.token_counter = snap['token_counter']
+        self.version = snap['version']
+
+    def apply_delta(self, delta):
+        """Replay a logged delta. Returns False if the shard already has it."""
+        if delta['version'] <= self.version:
+            return False
+        kind = delta['type']
+        if kind == 'token_added':
+            token = Token(**delta['token'])
+            self.queue.append(token)
+            self.token_counter = max(self.token_counter, token.id + 1)
+        elif kind == 'token_served':
+            token = delta['token']
+            self.current_token = Token(**token) if token else None
+            if token:
+                self.queue.remove(token['id'])
+        elif kind == 'token_removed':
+            self.queue.remove(delta['id'])
+        elif kind == 'current_cleared':
+            self.current_token = None
+        elif kind == 'status_changed':
+            self.professor_status = delta['status']
+        self.version = delta['version']
+        return True
+
+    def _delta(self, delta_type, **payload):
+        self.version += 1
+        delta = {'version': self.version, 'type': delta_type}
+        delta.update(payload)
+        return delta
+
+    def add_token(self, name, type, max_length=None):
+        if max_length and len(self.queue) >= max_length:
+            return None
+        token = Token(self.token_counter, name, type, datetime.now().strftime('%H:%M:%S'))
+        self.queue.append(token)
+        self.token_counter += 1
+        return self._delta('token_added', token=token.to_dict())
+
+    def set_status(self, status):
+        if status not in STATUSES:
+            return None
+        self.professor_status = status
+        return self._delta('status_changed', status=status)
+
+    def serve_next(self):
+        self.current_token = self.queue.popleft() if self.queue else None
+        current = self.current_token
+        return self._delta('token_served', token=current.to_dict() if current else None)
+
+    def cancel_token(self, token_id):
+        token = self.queue.remove(token_id)
+        if token is None:
+            return None
+        return self._delta('token_removed', id=token.id)
+
+    def clear_current(self):
+        self.current_token = None
+        return self._delta('current_cleared')
+
+
+class ShardRegistry:
+    """
+    Maps professor ids to their QueueShard, creating shards on first use.
+
+    Professor ids come from clients, so only `get` (used by mutations and
+    recovery) creates shards. Reads use `find`, which answers for an unknown
+    id with an empty shard that is not kept.
+    """
+
+    def __init__(self):
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def get(self, professor_id):
+        shard = self._shards.get(professor_id)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(professor_id)
+                if shard is None:
+                    shard = self._shards[professor_id] = QueueShard(professor_id)
+        return shard
+
+    def find(self, professor_id):
+        """The professor's shard, or a new empty one that is not registered"""
+        shard = self._shards.get(professor_id)
+        return shard if shard is not None else QueueShard(professor_id)
+
+    def __iter__(self):
+        return iter(list(self._shards.values()))
+
+    def __len__(self):
+        return len(self._shards)
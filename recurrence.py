@@ -0,0 +1,158 @@
+"""
+Expansion and validation for bulk timeslot creation.
+
+A recurrence rule describes a term's office hours in one object:
+
+    {
+        "freq": "weekly",              # or "daily"
+        "interval": 1,                 # every N weeks/days
+        "weekdays": ["mon", "thu"],    # weekly only; default: start_date's weekday
+        "start_date": "2026-01-05",
+        "end_date": "2026-04-30",      # inclusive
+        "start_time": "14:00",
+        "duration_minutes": 20,
+        "slots_per_day": 3,            # back-to-back slots per occurrence
+        "capacity": 1,
+        "label": "Office hours",
+        "timezone": "Asia/Kolkata"     # optional IANA name; default UTC
+    }
+
+A rule may span at most MAX_SPAN_DAYS days and expand to at most MAX_SLOTS
+slots. All datetimes leave this module as naive UTC, which is how pymongo stores them.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+
+from dateutil.parser import isoparse
+
+MAX_SLOTS = 1000
+MAX_SPAN_DAYS = 366  # Longest start_date..end_date range a rule may cover
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def to_utc_naive(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_capacity(value):
+    """Seats in a slot: a positive whole number; raises ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('capacity must be a positive whole number')
+    try:
+        capacity = int(value)
+    except (ValueError, OverflowError):
+        raise ValueError('capacity must be a positive whole number')
+    if capacity < 1 or capacity != float(value):
+        raise ValueError('capacity must be a positive whole number')
+    return capacity
+
+
+def parse_slot(data):
+    """Validate one explicit slot dict; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Each slot must be an object')
+    try:
+        # The same parser as POST /api/timeslots, so both accept the same timestamps
+        start = to_utc_naive(isoparse(data['start_ts']))
+        end = to_utc_naive(isoparse(data['end_ts']))
+    except (KeyError, TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid or missing start_ts/end_ts (ISO format)')
+    if end <= start:
+        raise ValueError(f"Slot ending {data['end_ts']} does not end after it starts")
+    return {
+        'start_ts': start,
+        'end_ts': end,
+        'capacity': parse_capacity(data.get('capacity', 1)),
+        'label': data.get('label')
+    }
+
+
+def expand_recurrence(rule):
+    """List of slot dicts generated by a recurrence rule; raises ValueError"""
+    if not isinstance(rule, dict):
+        raise ValueError('recurrence must be an object')
+    try:
+        freq = rule.get('freq', 'weekly')
+        if freq not in ('weekly', 'daily'):
+            raise ValueError("freq must be 'weekly' or 'daily'")
+        interval = int(rule.get('interval', 1))
+        first = date.fromisoformat(rule['start_date'])
+        last = date.fromisoformat(rule['end_date'])
+        start_time = time.fromisoformat(rule['start_time'])
+        duration = timedelta(minutes=int(rule['duration_minutes']))
+        per_day = int(rule.get('slots_per_day', 1))
+        capacity = parse_capacity(rule.get('capacity', 1))
+    except KeyError as e:
+        raise ValueError(f"Missing recurrence field: {e.args[0]}")
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid recurrence: {e}")
+    if interval < 1 or per_day < 1 or duration <= timedelta(0):
+        raise ValueError('interval, slots_per_day and duration_minutes must be positive')
+    if last < first:
+        raise ValueError('end_date is before start_date')
+    if (last - first).days >= MAX_SPAN_DAYS:
+        raise ValueError(f"A recurrence may span at most {MAX_SPAN_DAYS} days")
+
+    tz = timezone.utc
+    if rule.get('timezone'):
+        from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+        try:
+            tz = ZoneInfo(rule['timezone'])
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {rule['timezone']}")
+
+    if freq == 'weekly':
+        names = rule.get('weekdays') or [WEEKDAYS[first.weekday()]]
+        try:
+            weekdays = {WEEKDAYS.index(str(n).lower()[:3]) for n in names}
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid weekdays: {names}")
+        # Weeks are counted from the Monday of start_date's week
+        week0 = first.toordinal() - first.weekday()
+        days = (week + weekday for week in range(week0, last.toordinal() + 1, 7 * interval)
+                for weekday in sorted(weekdays))
+    else:
+        days = range(first.toordinal(), last.toordinal() + 1, interval)
+
+    slots = []
+    try:
+        for ordinal in days:
+            if not first.toordinal() <= ordinal <= last.toordinal():
+                continue
+            start = datetime.combine(date.fromordinal(ordinal), start_time, tzinfo=tz)
+            for _ in range(per_day):
+                slots.append({
+                    'start_ts': to_utc_naive(start),
+                    'end_ts': to_utc_naive(start + duration),
+                    'capacity': capacity,
+                    'label': rule.get('label')
+                })
+                start += duration
+                if len(slots) > MAX_SLOTS:
+                    raise ValueError(f"Recurrence expands to more than {MAX_SLOTS} slots")
+    except OverflowError:
+        raise ValueError('Recurrence runs past the supported date range')
+    return slots
+
+
+def find_overlaps(slots, existing=()):
+    """
+    Pairs of overlapping slots, as (slot, other) tuples.
+
+    `slots` are checked against each other and against `existing` (timeslot
+    documents already stored). Back-to-back slots (one ends as the next
+    starts) do not overlap. One sort and a sweep: O(n log n).
+    """
+    tagged = [(s['start_ts'], s['end_ts'], True, s) for s in slots]
+    tagged += [(s['start_ts'], s['end_ts'], False, s) for s in existing]
+    tagged.sort(key=lambda t: (t[0], t[1]))
+
+    overlaps = []
+    latest = None  # Entry with the latest end seen so far
+    for entry in tagged:
+        if latest is not None and entry[0] < latest[1] and (entry[2] or latest[2]):
+            overlaps.append((entry[3], latest[3]))
+        if latest is None or entry[1] > latest[1]:
+            latest = entry
+    return overlaps
@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of pre-encoded JSON response bodies.
+
+    Entries are keyed by the normalised query and stamped with the cache's
+    version. `invalidate()` bumps the version and drops every entry. ETags
+    combine a per-process id, the version and the key. A client holding the
+    current ETag can therefore be answered with 304 without looking anything
+    up. A stale ETag from an older version, or from another process, never
+    matches.
+
+    Eviction is LRU, bounded by both entry count and total body bytes.
+    Invalidation only reaches this process, so with several workers
+    `ttl` caps how long another worker's write can go unseen.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=8 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (body, etag, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._instance = uuid.uuid4().hex[:8]
+
+    def etag(self, key, version=None):
+        """ETag of `key`'s body at `version` (default: the current version)"""
+        version = self.version if version is None else version
+        return f'"{self._instance}-{version}-{zlib.crc32(key.encode()):08x}"'
+
+    def is_current(self, key, if_none_match):
+        """True if the client's If-None-Match already names the current body"""
+        if not if_none_match or if_none_match != self.etag(key):
+            return False
+        if self.ttl is not None:
+            # With a TTL, the ETag is only trusted while its entry is fresh
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl:
+                return False
+        with self._lock:
+            self.not_modified += 1
+        return True
+
+    def get(self, key):
+        """(body, etag) for a cached response, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body, version):
+        """Cache a body built while the cache was at `version`; returns its ETag.
+
+        A body built before an invalidation is returned to its caller but not
+        cached, so a racing write can't be hidden by an older read. Its ETag
+        names the version it was built at, so it never matches as current.
+        """
+        etag = self.etag(key, version)
+        with self._lock:
+            if version != self.version or len(body) > self.max_bytes:
+                return etag
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, etag, time.monotonic())
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return etag
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def _drop(self, key):
+        body, _, _ = self._entries.pop(key)
+        self._bytes -= len(body)
@@ -0,0 +1,56 @@
+"""
+Production entry point for the LineUp server.
+
+Runs server.py on eventlet's cooperative WSGI server instead of the Werkzeug
+development server. Each socket is a green thread, so a single process can
+hold thousands of concurrent connections. The standard library is
+monkey-patched before anything else is imported, which turns the per-shard
+threading.Lock objects into green locks so every queue mutation stays atomic.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000]
+
+Environment:
+    LINEUP_MAX_CONNECTIONS  Concurrent connection cap (default 10000)
+"""
+import os
+
+os.environ['LINEUP_ASYNC_MODE'] = 'eventlet'
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def raise_fd_limit():
+    """Each socket needs a file descriptor; lift the soft limit to the hard limit"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the LineUp server in production mode')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+
+    import server
+    server.run(host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
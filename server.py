@@ -1,35 +1,280 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
-from datetime import datetime
+from flask import Flask, render_template, request, jsonify, g
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+import base64
+import hmac
+import json
 import os
+import time
+from urllib.parse import urlencode
+
+from bson import ObjectId
+from dateutil.parser import isoparse
+from pymongo.errors import PyMongoError
+
+from queue_shard import DEFAULT_PROFESSOR_ID, room_for
+from queue_backend import InProcessBackend, MongoBackend
+from mongo_manager import MongoManager
+from broadcaster import (DEFAULT_VIEW_WINDOW, MAX_VIEW_WINDOW, BroadcastScheduler, ViewPublisher,
+                         timed_emit, view_room)
+from queue_log import QueueLog
+from admission import DUPLICATE, MESSAGES, QUEUE_FULL, RATE_LIMITED, ActiveTokens, TokenBuckets
+from response_cache import ResponseCache
+from db_pool import DbPool, PoolSaturated, PoolTimeout
+from service_stats import ServiceStats
+from snapshot_cache import SnapshotCache, encode_json, packet_json
+from wire_format import WireFormat
+from log_config import configure_logging
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, generate_latest, timed
 
 # MongoDB helpers (optional)
-from db_mongo import connect, list_timeslots, create_timeslot, book_timeslot
+from db_mongo import (breaker as mongo_breaker, connect, ensure_indexes, list_timeslots_page,
+                      list_timeslots_with_bookings, create_timeslot, create_timeslots, find_timeslots_overlapping,
+                      book_timeslot, MongoUnavailable, TIMESLOT_FIELDS)
+from circuit_breaker import CLOSED
+from recurrence import MAX_SLOTS, expand_recurrence, find_overlaps, parse_capacity, parse_slot
+
+logger = configure_logging()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# 'threading' for development; serve.py selects 'eventlet' for production
+ASYNC_MODE = os.environ.get('LINEUP_ASYNC_MODE', 'threading')
+# 'memory' keeps queues in this process; 'mongo' shares them between workers
+QUEUE_BACKEND = os.environ.get('LINEUP_QUEUE_BACKEND', 'memory')
+# 'json' (default) or 'msgpack' with positional tokens; clients read it from /api/wire-format
+wire = WireFormat(os.environ.get('LINEUP_WIRE_FORMAT', 'json'))
 
-# Connect to MongoDB if available
+# Create the MongoDB client; this doesn't wait for the server, so the queue
+# starts at once. Indexes are created in the background (see ensure_mongo_indexes).
 try:
     connect()
     MONGO_ENABLED = True
-except Exception:
+except Exception:  # e.g. a malformed MONGO_URI
+    logger.exception("MongoDB client could not be created; timeslot routes are disabled")
     MONGO_ENABLED = False
 
-# Application State
-state = {
-    'professor_status': 'Unavailable',  # Available, Busy, In Cabin, Unavailable
-    'current_token': None,
-    'queue': [],  # List of {id, name, type, timestamp}
-    'token_counter': 1
-}
+if QUEUE_BACKEND == 'mongo':
+    # Relay emits between workers so every socket sees every worker's deltas
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, json=packet_json,
+                        serializer=wire.serializer, client_manager=MongoManager(connect(), channel='lineup'))
+else:
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, json=packet_json,
+                        serializer=wire.serializer)
+
+# Queue deltas are batched per room and flushed once per window
+scheduler = BroadcastScheduler(socketio, window=float(os.environ.get('LINEUP_BROADCAST_WINDOW_MS', '50')) / 1000)
+
+def publish_delta(professor_id, delta):
+    """Log a versioned delta and queue it for the subscribers of one queue.
+
+    Backends call this while holding the queue's lock, so deltas reach the
+    log and the scheduler in version order. Clients apply deltas in version
+    order; a client that sees a gap asks for a full snapshot with `get_state`.
+    """
+    if queue_log:
+        queue_log.append(professor_id, delta)
+    if delta['type'] == 'token_served' and delta['token']:
+        active_tokens.release(professor_id, delta['token']['id'])
+    elif delta['type'] == 'token_removed':
+        active_tokens.release(professor_id, delta['id'])
+    service_stats.record(professor_id, delta)
+    if delta['type'] in ('token_served', 'current_cleared'):
+        # Full subscribers work out their ETA from the latest mean service times
+        delta = dict(delta, service_time=service_stats.summary(professor_id))
+    scheduler.mark_dirty(room_for(professor_id), wire.delta(delta))
+    views.mark_dirty(professor_id)
+
+# Recent served tokens per queue, with running mean wait and service times for ETAs
+service_stats = ServiceStats(capacity=int(os.environ.get('LINEUP_SERVICE_HISTORY', '1000')))
+
+# Application State: one queue per professor, held by the configured backend
+if QUEUE_BACKEND == 'mongo':
+    backend = MongoBackend(connect(), publish_delta)
+else:
+    backend = InProcessBackend(publish_delta)
+client_shards = {}  # sid -> professor id of the queue the socket is subscribed to
+# One encoded snapshot per queue version, shared by every connect and resync
+# (spliced in as JSON text, or kept as a compact object for msgpack)
+def encode_snapshot(snapshot, encode=wire.state if wire.compact else encode_json):
+    # Serving a token bumps the version, so the cached copy never outlives its service times
+    return encode(dict(snapshot, service_time=service_stats.summary(snapshot['professor_id'])))
+
+snapshots = SnapshotCache(backend, encode=encode_snapshot)
+
+# Windowed subscribers get a periodic view of the queue head instead of every delta.
+# Other workers can change a MongoDB-backed queue, so those views are polled.
+views = ViewPublisher(socketio, backend, interval=scheduler.window or 0.05, poll=backend.name == 'mongo',
+                      encode=wire.state, eta=service_stats.etas)
+
+# Admission control for request_token: rate limits per socket and per address
+# (rate 0 disables), a maximum queue length (0 = unlimited) and one waiting
+# token per client
+sid_buckets = TokenBuckets(rate=float(os.environ.get('LINEUP_TOKEN_RATE', '0.2')),
+                           burst=int(os.environ.get('LINEUP_TOKEN_BURST', '3')))
+# A lecture hall usually shares one NAT address, so the address bucket must
+# absorb a whole hall requesting at once; it only stops floods from one host
+address_buckets = TokenBuckets(rate=float(os.environ.get('LINEUP_ADDRESS_TOKEN_RATE', '20')),
+                               burst=int(os.environ.get('LINEUP_ADDRESS_TOKEN_BURST', '1000')))
+MAX_QUEUE_LENGTH = int(os.environ.get('LINEUP_MAX_QUEUE_LENGTH', '0'))
+DEDUPE_TOKENS = os.environ.get('LINEUP_DEDUPE_TOKENS', '1') == '1'
+# Also records who requested each token, which cancel_token checks
+active_tokens = ActiveTokens(backend.is_queued)
+
+# Sockets that connected with this key in their auth data act as the professor,
+# who may cancel any token. Unset: tokens can only be cancelled by their owner.
+PROFESSOR_KEY = os.environ.get('LINEUP_PROFESSOR_KEY')
+professor_sids = set()
+
+# Durable queue state (optional): write-ahead log + periodic snapshots.
+# Only needed for the in-process backend; MongoDB is already durable.
+DATA_DIR = os.environ.get('LINEUP_DATA_DIR')
+queue_log = None
+if DATA_DIR and backend.name == 'memory':
+    queue_log = QueueLog(
+        DATA_DIR,
+        flush_interval=float(os.environ.get('LINEUP_WAL_FLUSH_MS', '50')) / 1000,
+        snapshot_every=int(os.environ.get('LINEUP_SNAPSHOT_EVERY', '10000'))
+    )
+    replayed = queue_log.recover(backend.shards)
+    queue_log.start()
+    logger.info("Recovered %d queue(s) from %s (%d log records replayed)", len(backend.shards), DATA_DIR, replayed)
+
+def take_snapshot():
+    """Snapshot every shard; the log's flusher thread writes it and drops the segments it covers"""
+    segment = queue_log.rotate()
+    snaps = []
+    for shard in backend.shards:
+        with shard.lock:
+            snaps.append(shard.snapshot())
+    # Encoding and fsync would block eventlet's hub; the flusher is a real OS thread
+    queue_log.queue_snapshot(segment, snaps)
+
+def snapshot_loop():
+    while True:
+        socketio.sleep(1)
+        if queue_log.needs_snapshot():
+            take_snapshot()
+
+if queue_log:
+    socketio.start_background_task(snapshot_loop)
+
+def ensure_mongo_indexes():
+    """Create the timeslot indexes once MongoDB is reachable, retrying with backoff"""
+    delay = 1
+    while True:
+        try:
+            ensure_indexes()
+            logger.info("MongoDB indexes ready")
+            return
+        except (MongoUnavailable, PyMongoError) as e:
+            logger.warning("MongoDB indexes not created yet (%s); retrying in %ds", e, delay)
+        socketio.sleep(delay)
+        delay = min(delay * 2, 60)
+
+if MONGO_ENABLED:
+    socketio.start_background_task(ensure_mongo_indexes)
+
+# Timeslot routes run their MongoDB calls on this bounded pool, off the
+# threads that serve Socket.IO, and answer 503 when it is saturated
+db_pool = DbPool(
+    max_workers=int(os.environ.get('LINEUP_DB_WORKERS', '8')),
+    max_pending=int(os.environ.get('LINEUP_DB_QUEUE', '32')),
+    timeout=float(os.environ.get('LINEUP_DB_TIMEOUT_MS', '5000')) / 1000
+)
+
+def normalize_professor_id(value):
+    """Clean up a client-supplied professor id, falling back to the default queue"""
+    value = (value or '').strip()[:64]
+    return value or DEFAULT_PROFESSOR_ID
+
+def current_professor():
+    """Professor id of the queue the calling socket is subscribed to"""
+    return client_shards.get(request.sid, DEFAULT_PROFESSOR_ID)
+
+def parse_window(view, window):
+    """Window size for a client asking for `view=window`, or None for the full view"""
+    if view != 'window':
+        return None
+    try:
+        window = int(window or DEFAULT_VIEW_WINDOW)
+    except (TypeError, ValueError):
+        window = DEFAULT_VIEW_WINDOW
+    return min(max(window, 1), MAX_VIEW_WINDOW)
+
+def parse_version(value):
+    """Last-seen version sent by a client, or None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def send_state(professor_id, known_version=None):
+    """Send the calling socket a queue's snapshot, or `state_current` if it already has that version"""
+    version = backend.version(professor_id)
+    # Replies go to this socket only, so they skip the inter-worker message queue
+    if known_version == version:
+        emit('state_current', {'version': version}, ignore_queue=True)
+    else:
+        emit('state_update', snapshots.get(professor_id, version)[1], ignore_queue=True)
+
+def subscribe(professor_id, window=None, known_version=None):
+    """Move the calling socket to a professor's queue and send it the current state.
+
+    Full subscribers join the queue's delta room and get a snapshot. With a
+    `window`, the socket joins a view room instead and gets `queue_view`
+    updates with only the head of the queue.
+    """
+    sid = request.sid
+    for room in rooms():
+        if room != sid:
+            leave_room(room)
+    client_shards[sid] = professor_id
+    if window is None:
+        views.unsubscribe(sid)
+        join_room(room_for(professor_id))
+        send_state(professor_id, known_version)
+    else:
+        views.subscribe(sid, professor_id, window)
+        join_room(view_room(professor_id, window))
+        views.send(sid)
+
+# Metrics
+SOCKET_HANDLER_SECONDS = Histogram('lineup_socketio_handler_seconds', 'Socket.IO event handler latency', ['event'])
+HTTP_REQUEST_SECONDS = Histogram('lineup_http_request_seconds', 'REST route latency', ['route', 'method'])
+HTTP_RESPONSES = Counter('lineup_http_responses_total', 'REST responses by status', ['route', 'method', 'status'])
+CONNECTED_SOCKETS = Gauge('lineup_connected_sockets', 'Socket.IO connections to this process')
+TOKEN_REJECTIONS = Counter('lineup_token_rejections_total', 'request_token calls refused by admission control',
+                           ['reason'])
+MONGO_CIRCUIT_OPEN = Gauge('lineup_mongo_circuit_open', 'Whether the MongoDB circuit breaker is refusing calls',
+                          function=lambda: int(mongo_breaker.state != CLOSED))
+DB_POOL_IN_FLIGHT = Gauge('lineup_db_pool_in_flight', 'Database calls running or waiting on the worker pool',
+                          function=lambda: db_pool.in_flight)
+QUEUE_DEPTH = Gauge('lineup_queue_depth', 'Tokens waiting per professor queue', ['professor'],
+                    function=lambda: {(pid,): depth for pid, depth in backend.queue_depths().items()})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - start)
+        HTTP_RESPONSES.labels(route, request.method, response.status_code).inc()
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE}
 
 # Routes
 @app.route('/')
 def student():
     """Student interface"""
-    return render_template('student.html')
+    return render_template('student.html', wire_format=wire.describe())
 
 @app.route('/professor')
 def professor():
@@ -37,120 +282,459 @@ def professor():
     return render_template('professor.html')
 
 
+@app.route('/api/wire-format', methods=['GET'])
+def api_wire_format():
+    """Socket.IO payload format clients must use: json, or msgpack with positional tokens"""
+    return jsonify(wire.describe())
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """
+    Wait and service times over each queue's recent served tokens
+    (LINEUP_SERVICE_HISTORY, default 1000), overall and per token type.
+    `?professor=<id>` limits the reply to one queue.
+    """
+    stats = service_stats.stats()
+    if 'professor' in request.args:
+        professor_id = normalize_professor_id(request.args['professor'])
+        stats = {professor_id: stats[professor_id]} if professor_id in stats else {}
+    return jsonify({'queues': stats})
+
+@app.route('/api/broadcast/stats', methods=['GET'])
+def api_broadcast_stats():
+    """Broadcast coalescing counters, including emits saved by batching, and snapshot cache counters"""
+    return jsonify(dict(scheduler.stats(), snapshot_cache=snapshots.stats()))
+
+
+# Serialised /api/timeslots pages; dropped whenever a timeslot changes through this
+# process. Several workers (the mongo backend) don't see each other's writes, so
+# their entries and ETags expire after a few seconds by default.
+TIMESLOT_CACHE_TTL = os.environ.get('LINEUP_TIMESLOT_CACHE_TTL', '5' if QUEUE_BACKEND == 'mongo' else None)
+timeslot_cache = ResponseCache(
+    max_entries=int(os.environ.get('LINEUP_TIMESLOT_CACHE_ENTRIES', '256')),
+    ttl=float(TIMESLOT_CACHE_TTL) if TIMESLOT_CACHE_TTL is not None else None
+)
+
+def encode_cursor(after):
+    """Opaque page cursor from a (start_ts, _id) key"""
+    start_ts, oid = after
+    raw = json.dumps([start_ts.isoformat(), str(oid)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(start_ts, _id) key from a page cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        start_ts, oid = json.loads(raw)
+        return isoparse(start_ts), ObjectId(oid)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+@app.errorhandler(MongoUnavailable)
+def mongo_unavailable(e):
+    """Timeslot routes answer 503 at once while MongoDB is down, instead of waiting on it"""
+    retry_after = max(1, round(e.retry_after))
+    return jsonify({'error': 'MongoDB unavailable, try again shortly', 'retry_after': retry_after}), \
+        503, {'Retry-After': str(retry_after)}
+
+@app.errorhandler(PoolSaturated)
+def db_pool_saturated(e):
+    return jsonify({'error': 'Server busy, try again shortly', 'retry_after': 1}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(PoolTimeout)
+def db_pool_timeout(e):
+    # The write may still land; its timeslot_update/booking_update is sent when it does
+    return jsonify({'error': 'Database request timed out; it may still complete'}), 504
+
+def timeslot_json(t):
+    return {'id': str(t['_id']), 'start_ts': t['start_ts'].isoformat(), 'end_ts': t['end_ts'].isoformat(),
+            'capacity': t['capacity'], 'label': t['label']}
+
+# The notify_* functions run on a db_pool worker once a write completes, even if the request timed out
+
+def notify_timeslot_created(t):
+    timeslot_cache.invalidate()
+    timed_emit(socketio, 'timeslot_update', {'action': 'created', 'timeslot': timeslot_json(t)})
+
+def notify_timeslots_created(docs):
+    timeslot_cache.invalidate()
+    # One aggregated notification instead of one per slot
+    timed_emit(socketio, 'timeslot_update', {'action': 'bulk_created', 'timeslots': [timeslot_json(t) for t in docs]})
+
+def notify_booking_created(booking):
+    timeslot_cache.invalidate()
+    b = dict(booking)
+    b['id'] = str(b.pop('_id'))
+    b['timeslot_id'] = str(b['timeslot_id'])
+    b['created_at'] = b['created_at'].isoformat()
+    timed_emit(socketio, 'booking_update', {'action': 'created', 'booking': b})
+
+def parse_page_args():
+    """(start_from, start_to, limit, after) from the from/to/limit/cursor query parameters.
+    Raises ValueError with a message for the client."""
+    try:
+        start_from = isoparse(request.args['from']) if 'from' in request.args else None
+        start_to = isoparse(request.args['to']) if 'to' in request.args else None
+    except (ValueError, OverflowError):
+        raise ValueError('Invalid from/to (ISO format)')
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    after = decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    return start_from, start_to, limit, after
+
+def cached_json(prefix, build):
+    """
+    Response for a timeslot query from timeslot_cache, honouring If-None-Match.
+    `build()` returns the body as a dict on a miss.
+    """
+    # Normalise parameter order so equivalent queries share an entry
+    key = prefix + urlencode(sorted(request.args.items(multi=True)))
+    if timeslot_cache.is_current(key, request.headers.get('If-None-Match')):
+        return '', 304, {'ETag': timeslot_cache.etag(key)}
+    cached = timeslot_cache.get(key)
+    if cached is None:
+        version = timeslot_cache.version
+        body = app.json.dumps(build()).encode()
+        cached = body, timeslot_cache.put(key, body, version)
+    body, etag = cached
+    return app.response_class(body, mimetype='application/json',
+                              headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+def timeslot_doc_json(d, fields=None):
+    """Serialize ObjectId and datetimes simply"""
+    d = dict(d)
+    d['id'] = str(d.pop('_id'))
+    if fields is not None and 'start_ts' not in fields:
+        d.pop('start_ts', None)  # Fetched only for the cursor
+    for k in ('start_ts', 'end_ts'):
+        if hasattr(d.get(k), 'isoformat'):
+            d[k] = d[k].isoformat()
+    return d
+
 # Timeslot REST API (MongoDB-backed if available)
 @app.route('/api/timeslots', methods=['GET'])
 def api_list_timeslots():
+    """
+    List active timeslots by start time, one page at a time.
+
+    Query parameters (all optional):
+      from, to  ISO8601 bounds on start_ts (from inclusive, to exclusive)
+      limit     page size, 1-500 (default 100)
+      cursor    next_cursor from the previous page
+      fields    comma-separated fields to return, e.g. start_ts,end_ts,label
+    """
     if not MONGO_ENABLED:
         return jsonify({'error': 'MongoDB not enabled'}), 500
-    docs = list_timeslots()
-    # Serialize ObjectId and datetimes simply
-    def s(d):
-        d = dict(d)
-        d['id'] = str(d.pop('_id'))
-        d['start_ts'] = d['start_ts'].isoformat() if hasattr(d.get('start_ts'), 'isoformat') else d.get('start_ts')
-        d['end_ts'] = d['end_ts'].isoformat() if hasattr(d.get('end_ts'), 'isoformat') else d.get('end_ts')
-        return d
-    return jsonify([s(x) for x in docs])
+    try:
+        start_from, start_to, limit, after = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fields = None
+    if 'fields' in request.args:
+        fields = [f for f in request.args['fields'].split(',') if f]
+        unknown = [f for f in fields if f not in TIMESLOT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    def build():
+        docs, next_after = db_pool.run(list_timeslots_page, start_from, start_to, limit=limit, after=after,
+                                       fields=fields)
+        return {
+            'timeslots': [timeslot_doc_json(x, fields) for x in docs],
+            'next_cursor': encode_cursor(next_after) if next_after else None
+        }
+    return cached_json('', build)
+
+
+@app.route('/api/timeslots/bookings', methods=['GET'])
+def api_list_timeslot_bookings():
+    """
+    Active timeslots with their bookings, one page at a time, from a single
+    aggregation (see db_mongo.list_timeslots_with_bookings).
+
+    Takes from, to, limit and cursor like GET /api/timeslots, plus
+      include   'bookings' (default) for each slot's bookings, or 'counts'
+                for just the number of bookings per status
+    """
+    if not MONGO_ENABLED:
+        return jsonify({'error': 'MongoDB not enabled'}), 500
+    try:
+        start_from, start_to, limit, after = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    include = request.args.get('include', 'bookings')
+    if include not in ('bookings', 'counts'):
+        return jsonify({'error': "include must be 'bookings' or 'counts'"}), 400
+
+    def booking_json(b):
+        b = dict(b)
+        b['id'] = str(b.pop('_id'))
+        if hasattr(b.get('created_at'), 'isoformat'):
+            b['created_at'] = b['created_at'].isoformat()
+        return b
+
+    def build():
+        docs, next_after = db_pool.run(list_timeslots_with_bookings, start_from, start_to, limit=limit,
+                                       after=after, counts_only=include == 'counts')
+        timeslots = [timeslot_doc_json(x) for x in docs]
+        if include == 'bookings':
+            for t in timeslots:
+                t['bookings'] = [booking_json(b) for b in t['bookings']]
+        return {
+            'timeslots': timeslots,
+            'next_cursor': encode_cursor(next_after) if next_after else None
+        }
+    return cached_json('bookings?', build)
+
+
+@app.route('/api/timeslots/cache/stats', methods=['GET'])
+def api_timeslot_cache_stats():
+    """Hit/miss counters for the timeslot listing cache"""
+    return jsonify(timeslot_cache.stats())
 
 
 @app.route('/api/timeslots', methods=['POST'])
 def api_create_timeslot():
     if not MONGO_ENABLED:
         return jsonify({'error': 'MongoDB not enabled'}), 500
-    data = request.get_json() or {}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     try:
         # Expect ISO8601 strings for start/end
-        from dateutil import parser
-        start = parser.isoparse(data['start_ts'])
-        end = parser.isoparse(data['end_ts'])
+        start = isoparse(data['start_ts'])
+        end = isoparse(data['end_ts'])
     except Exception:
         return jsonify({'error': 'Invalid or missing start_ts/end_ts (ISO format)'}), 400
-    capacity = int(data.get('capacity', 1))
+    try:
+        capacity = parse_capacity(data.get('capacity', 1))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     label = data.get('label')
-    t = create_timeslot(start, end, capacity=capacity, label=label)
-    # Notify clients
-    socketio.emit('timeslot_update', {'action': 'created', 'timeslot': {'id': str(t['_id']), 'start_ts': start.isoformat(), 'end_ts': end.isoformat(), 'capacity': capacity, 'label': label}})
+    t = db_pool.run(create_timeslot, start, end, capacity=capacity, label=label, then=notify_timeslot_created)
     return jsonify({'id': str(t['_id'])}), 201
 
 
+@app.route('/api/timeslots/bulk', methods=['POST'])
+def api_create_timeslots_bulk():
+    """
+    Create many timeslots at once from either an explicit list
+    ({"slots": [{start_ts, end_ts, capacity, label}, ...]}) or a recurrence
+    rule ({"recurrence": {...}}, see recurrence.py). Slots must not overlap
+    each other or existing active slots. Sends one timeslot_update event.
+    """
+    if not MONGO_ENABLED:
+        return jsonify({'error': 'MongoDB not enabled'}), 500
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': "Provide either 'slots' or 'recurrence'"}), 400
+    try:
+        if 'recurrence' in data:
+            slots = expand_recurrence(data['recurrence'])
+        elif isinstance(data.get('slots'), list):
+            if len(data['slots']) > MAX_SLOTS:
+                raise ValueError(f"At most {MAX_SLOTS} slots per request")
+            slots = [parse_slot(x) for x in data['slots']]
+        else:
+            raise ValueError("Provide either 'slots' or 'recurrence'")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not slots:
+        return jsonify({'error': 'No slots to create'}), 400
+
+    existing = db_pool.run(find_timeslots_overlapping,
+                           min(x['start_ts'] for x in slots), max(x['end_ts'] for x in slots))
+    overlaps = find_overlaps(slots, existing)
+    if overlaps:
+        def describe(x):
+            return {'start_ts': x['start_ts'].isoformat(), 'end_ts': x['end_ts'].isoformat(),
+                    'id': str(x['_id']) if '_id' in x else None}
+        return jsonify({'error': 'Overlapping timeslots',
+                        'overlaps': [[describe(a), describe(b)] for a, b in overlaps[:20]]}), 409
+
+    docs = db_pool.run(create_timeslots, slots, then=notify_timeslots_created)
+    ids = [str(t['_id']) for t in docs]
+    return jsonify({'ids': ids, 'count': len(ids)}), 201
+
+
 @app.route('/api/timeslots/<timeslot_id>/book', methods=['POST'])
 def api_book_timeslot(timeslot_id):
     if not MONGO_ENABLED:
         return jsonify({'error': 'MongoDB not enabled'}), 500
-    data = request.get_json() or {}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     name = data.get('name')
     contact = data.get('contact')
     if not name:
         return jsonify({'error': 'Missing name'}), 400
     try:
-        booking = book_timeslot(timeslot_id, name, contact)
+        booking = db_pool.run(book_timeslot, timeslot_id, name, contact, then=notify_booking_created)
     except RuntimeError as e:
         return jsonify({'error': str(e)}), 409
-    # Notify clients
-    b = dict(booking)
-    b['id'] = str(b.pop('_id'))
-    b['timeslot_id'] = str(b['timeslot_id'])
-    socketio.emit('booking_update', {'action': 'created', 'booking': b})
-    return jsonify({'id': b['id']}), 201
+    return jsonify({'id': str(booking['_id'])}), 201
 
 # SocketIO Events
 @socketio.on('connect')
-def handle_connect():
-    """Send current state when client connects"""
-    emit('state_update', state)
-    print(f"Client connected at {datetime.now()}")
+@timed(SOCKET_HANDLER_SECONDS, 'connect')
+def handle_connect(auth=None):
+    """Subscribe the client to the queue named in `?professor=` (and `?view=window&window=N`).
+
+    A reconnecting client can pass its last-seen `?version=` to skip the snapshot if nothing changed.
+    """
+    subscribe(normalize_professor_id(request.args.get('professor')),
+              parse_window(request.args.get('view'), request.args.get('window')),
+              parse_version(request.args.get('version')))
+    if PROFESSOR_KEY and isinstance(auth, dict) and \
+            hmac.compare_digest(str(auth.get('professor_key', '')), PROFESSOR_KEY):
+        professor_sids.add(request.sid)
+    CONNECTED_SOCKETS.inc()
+    logger.debug("Client connected: %s", request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    CONNECTED_SOCKETS.dec()
+    client_shards.pop(request.sid, None)
+    views.unsubscribe(request.sid)
+    sid_buckets.forget(request.sid)
+    active_tokens.forget_client(('sid', request.sid))
+    professor_sids.discard(request.sid)
+
+@socketio.on('join_queue')
+@timed(SOCKET_HANDLER_SECONDS, 'join_queue')
+def handle_join_queue(data):
+    """Switch the client to another professor's queue, or between full and windowed views"""
+    data = data or {}
+    subscribe(normalize_professor_id(data.get('professor_id')), parse_window(data.get('view'), data.get('window')),
+              parse_version(data.get('version')))
 
 @socketio.on('request_token')
+@timed(SOCKET_HANDLER_SECONDS, 'request_token')
 def handle_token_request(data):
-    """Handle student token request"""
-    token = {
-        'id': state['token_counter'],
-        'name': data.get('name', 'Anonymous'),
-        'type': data.get('type', 'General'),
-        'timestamp': datetime.now().strftime('%H:%M:%S')
-    }
-    state['queue'].append(token)
-    state['token_counter'] += 1
-    
-    # Broadcast update to all clients
-    socketio.emit('state_update', state)
-    print(f"Token requested: {token}")
+    """Handle student token request.
+
+    The ack carries the new token's id, or `error` and `message` if admission
+    control refused it. Duplicates are caught by socket id and, if the
+    client sends a stable `client_id`, across reconnects as well.
+    """
+    data = data or {}
+    professor_id = current_professor()
+    if not (sid_buckets.allow(request.sid) and address_buckets.allow(request.remote_addr)):
+        return reject_token_request(RATE_LIMITED)
+    clients = client_keys(data)
+    if DEDUPE_TOKENS:
+        accepted, existing = active_tokens.reserve(professor_id, clients)
+        if not accepted:
+            return reject_token_request(DUPLICATE, id=existing)
+    try:
+        delta = backend.add_token(professor_id, data.get('name', 'Anonymous'), data.get('type', 'General'),
+                                  MAX_QUEUE_LENGTH)
+    except Exception:
+        active_tokens.cancel(professor_id, clients)
+        raise
+    if delta is None:
+        active_tokens.cancel(professor_id, clients)
+        return reject_token_request(QUEUE_FULL)
+    logger.debug("Token requested: %s", delta['token'])
+    token_id = delta['token']['id']
+    active_tokens.assign(professor_id, clients, token_id)
+    views.track(request.sid, token_id)
+    return {'id': token_id}
+
+def client_keys(data):
+    """ActiveTokens keys of the calling client: its socket id, plus the client id the page sends.
+    Both are checked: the client id survives reconnects, the socket id can't be rotated."""
+    clients = [('sid', request.sid)]
+    if data.get('client_id'):
+        clients.append(('client', str(data['client_id'])[:64]))
+    return clients
+
+def reject_token_request(reason, **extra):
+    """Ack for a refused request_token"""
+    TOKEN_REJECTIONS.labels(reason).inc()
+    logger.info("request_token from %s refused: %s", request.remote_addr, reason)
+    reply = {'error': reason, 'message': MESSAGES[reason]}
+    reply.update(extra)
+    return reply
+
+@socketio.on('watch_token')
+@timed(SOCKET_HANDLER_SECONDS, 'watch_token')
+def handle_watch_token(data):
+    """Send a windowed client the position of a token it already holds (e.g. after reconnecting)"""
+    views.track(request.sid, (data or {}).get('id'))
 
 @socketio.on('update_status')
+@timed(SOCKET_HANDLER_SECONDS, 'update_status')
 def handle_status_update(data):
     """Update professor status"""
-    new_status = data.get('status')
-    if new_status in ['Available', 'Busy', 'In Cabin', 'Unavailable']:
-        state['professor_status'] = new_status
-        socketio.emit('state_update', state)
-        print(f"Status updated to: {new_status}")
+    delta = backend.set_status(current_professor(), data.get('status'))
+    if delta:
+        logger.info("Status updated to: %s", delta['status'])
 
 @socketio.on('next_token')
+@timed(SOCKET_HANDLER_SECONDS, 'next_token')
 def handle_next_token():
     """Move to next token in queue"""
-    if state['queue']:
-        state['current_token'] = state['queue'].pop(0)
-        socketio.emit('state_update', state)
-        print(f"Now serving: {state['current_token']}")
+    delta = backend.serve_next(current_professor())
+    if delta['token']:
+        logger.debug("Now serving: %s", delta['token'])
     else:
-        state['current_token'] = None
-        socketio.emit('state_update', state)
-        print("Queue is empty")
+        logger.debug("Queue is empty")
+
+@socketio.on('cancel_token')
+@timed(SOCKET_HANDLER_SECONDS, 'cancel_token')
+def handle_cancel_token(data=None):
+    """Remove a waiting token from the queue by id.
+
+    Only the socket or `client_id` that requested the token, or a professor
+    socket (see LINEUP_PROFESSOR_KEY), may cancel it. The ack carries the id,
+    or `error` and `message`.
+    """
+    token_id = data.get('id') if isinstance(data, dict) else None
+    if not isinstance(token_id, int) or isinstance(token_id, bool):
+        return {'error': 'bad_request', 'message': 'Expected {"id": <token id>}'}
+    professor_id = current_professor()
+    if request.sid not in professor_sids and not active_tokens.owns(professor_id, client_keys(data), token_id):
+        return {'error': 'forbidden', 'message': 'Only the student who requested a token or the professor can cancel it'}
+    delta = backend.cancel_token(professor_id, token_id)
+    if delta is None:
+        return {'error': 'not_found', 'message': 'That token is not waiting in this queue'}
+    logger.debug("Token cancelled: %s", delta['id'])
+    return {'id': token_id}
 
 @socketio.on('clear_current')
+@timed(SOCKET_HANDLER_SECONDS, 'clear_current')
 def handle_clear_current():
     """Clear current token"""
-    state['current_token'] = None
-    socketio.emit('state_update', state)
-    print("Current token cleared")
+    backend.clear_current(current_professor())
+    logger.debug("Current token cleared")
 
 @socketio.on('get_state')
-def handle_get_state():
-    """Send current state to requesting client"""
-    emit('state_update', state)
+@timed(SOCKET_HANDLER_SECONDS, 'get_state')
+def handle_get_state(data=None):
+    """Send a full snapshot to a client (initial load or after a version gap).
+
+    With `{'version': N}`, a client that is already at N gets `state_current` instead.
+    """
+    if views.is_subscribed(request.sid):
+        views.send(request.sid)
+    else:
+        send_state(current_professor(), parse_version((data or {}).get('version')))
+
+def run(host='0.0.0.0', port=5000):
+    """Start the Socket.IO server in the configured async mode"""
+    logger.info("🚀 Server starting on http://localhost:%d (%s mode)", port, socketio.async_mode)
+    logger.info("📱 Student interface: http://localhost:%d (add ?professor=<id> for a specific queue)", port)
+    logger.info("👨‍🏫 Professor dashboard: http://localhost:%d/professor", port)
+    if socketio.async_mode == 'threading':
+        # Werkzeug development server
+        socketio.run(app, host=host, port=port, debug=False, allow_unsafe_werkzeug=True)
+    else:
+        # eventlet's WSGI server caps concurrent connections at max_size (default 1024)
+        max_size = int(os.environ.get('LINEUP_MAX_CONNECTIONS', '10000'))
+        socketio.run(app, host=host, port=port, debug=False, max_size=max_size)
 
 if __name__ == '__main__':
-    print("🚀 Server starting on http://localhost:5000")
-    print("📱 Student interface: http://localhost:5000")
-    print("👨‍🏫 Professor dashboard: http://localhost:5000/professor")
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False, allow_unsafe_werkzeug=True)
+    run()
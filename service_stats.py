@@ -0,0 +1,275 @@
+"""
+Served-token history and service-time statistics, for queue ETAs.
+
+Each queue keeps its last `capacity` served tokens in a ring buffer of
+parallel arrays (type, join time, serve time, service time). Sums
+per token type are updated as entries are written and as the oldest are
+overwritten, so the means over the window cost O(1) per event and are never
+recomputed from the history.
+
+A token's service time runs from when it is served until the professor
+serves the next one or clears it. Join times are taken from `token_added`
+deltas. Tokens this process did not see being added (replayed from the log,
+or added on another worker) fall back to their HH:MM:SS timestamp. The
+statistics are per process, so with several workers each one describes the
+tokens served through it.
+"""
+import threading
+import time
+from array import array
+from datetime import datetime
+
+NO_TYPE = 0xFFFF  # Type index for tokens past max_types; counted in the overall means only
+
+
+class _Sums:
+    __slots__ = ('served', 'wait', 'finished', 'service')
+
+    def __init__(self):
+        self.served = 0
+        self.wait = 0.0
+        self.finished = 0
+        self.service = 0.0
+
+
+class ServiceHistory:
+    """
+    The last `capacity` served tokens of one queue, with running sums.
+
+    Only the first `max_types` distinct token types get their own means;
+    types are chosen by clients, so the table must stay bounded.
+    """
+
+    def __init__(self, capacity=1000, max_types=32):
+        self.capacity = capacity
+        self.max_types = max_types
+        self.types = []          # type index -> name
+        self._type_index = {}    # name -> type index
+        self._type = array('H', [0]) * capacity
+        self._joined = array('d', [0.0]) * capacity
+        self._served = array('d', [0.0]) * capacity
+        self._service = array('d', [0.0]) * capacity  # < 0 while the token is still being served
+        self._next = 0       # slot the next entry is written to
+        self.count = 0       # slots in use
+        self._open = None    # slot of the token being served, if any
+        self._total = _Sums()
+        self._by_type = {}   # type index -> _Sums
+        self._lock = threading.Lock()
+
+    def served(self, type, joined, served):
+        """Record a token being served at `served`; this finishes the previous one"""
+        with self._lock:
+            self._finish(served)
+            slot = self._next
+            if self.count == self.capacity:
+                self._evict(slot)
+            else:
+                self.count += 1
+            index = self._index(type)
+            self._type[slot] = index
+            self._joined[slot] = joined
+            self._served[slot] = served
+            self._service[slot] = -1.0
+            wait = max(0.0, served - joined)
+            for sums in self._sums(index):
+                sums.served += 1
+                sums.wait += wait
+            self._open = slot
+            self._next = (slot + 1) % self.capacity
+
+    def finished(self, at):
+        """Record the professor finishing the current token (cleared without a next one)"""
+        with self._lock:
+            self._finish(at)
+
+    def summary(self):
+        """Mean service seconds overall and per type, as sent to clients"""
+        with self._lock:
+            total = self._total
+            return {
+                'mean': round(total.service / total.finished, 1) if total.finished else None,
+                'by_type': {self.types[index]: round(sums.service / sums.finished, 1)
+                            for index, sums in self._by_type.items() if sums.finished}
+            }
+
+    def stats(self):
+        """Window counters and means for /api/stats"""
+        with self._lock:
+            def describe(sums):
+                return {
+                    'served': sums.served,
+                    'mean_wait': sums.wait / sums.served if sums.served else None,
+                    'mean_service': sums.service / sums.finished if sums.finished else None
+                }
+            return dict(describe(self._total), window=self.capacity, by_type={
+                self.types[index]: describe(sums) for index, sums in self._by_type.items()
+            })
+
+    def etas(self, queue, positions=None, now=None):
+        """
+        Estimated seconds until each token in `queue` (the head of a queue, in
+        order) is called, and for every token id in `positions` ({token id:
+        queue position}). Positions past `queue` are extrapolated with the
+        overall mean. Estimates are None until a service time has been seen.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            total = self._total
+            overall = total.service / total.finished if total.finished else None
+            if overall is None:
+                return [None] * len(queue), {tid: None for tid in positions or ()}
+            # Whatever is left of the current token's expected service time
+            eta = 0.0
+            if self._open is not None:
+                expected = self._mean_for(self._type[self._open], overall)
+                eta = max(0.0, expected - (now - self._served[self._open]))
+            etas = []
+            for token in queue:
+                etas.append(round(eta))
+                eta += self._mean_for(self._type_index.get(token['type'], NO_TYPE), overall)
+        by_token = {}
+        for tid, position in (positions or {}).items():
+            if position is None:
+                by_token[tid] = None
+            elif position == 0:
+                by_token[tid] = 0
+            elif position <= len(etas):
+                by_token[tid] = etas[position - 1]
+            else:
+                by_token[tid] = round(eta + (position - 1 - len(etas)) * overall)
+        return etas, by_token
+
+    def _finish(self, at):
+        slot = self._open
+        if slot is None:
+            return
+        self._open = None
+        service = max(0.0, at - self._served[slot])
+        self._service[slot] = service
+        for sums in self._sums(self._type[slot]):
+            sums.finished += 1
+            sums.service += service
+
+    def _evict(self, slot):
+        if self._open == slot:
+            self._open = None
+        wait = max(0.0, self._served[slot] - self._joined[slot])
+        service = self._service[slot]
+        for sums in self._sums(self._type[slot]):
+            sums.served -= 1
+            sums.wait -= wait
+            if service >= 0:
+                sums.finished -= 1
+                sums.service -= service
+
+    def _index(self, type):
+        index = self._type_index.get(type)
+        if index is None:
+            if len(self.types) >= self.max_types:
+                return NO_TYPE
+            index = self._type_index[type] = len(self.types)
+            self.types.append(type)
+        return index
+
+    def _sums(self, index):
+        if index == NO_TYPE:
+            return (self._total,)
+        sums = self._by_type.get(index)
+        if sums is None:
+            sums = self._by_type[index] = _Sums()
+        return self._total, sums
+
+    def _mean_for(self, index, overall):
+        sums = self._by_type.get(index)
+        return sums.service / sums.finished if sums is not None and sums.finished else overall
+
+
+class ServiceStats:
+    """
+    A ServiceHistory per professor id, fed with every queue delta.
+
+    `record` is called from the server's publish hook, so it sees the deltas
+    of this process in version order. Join times of waiting tokens are kept
+    until the token is served or cancelled. With several workers, tokens
+    added here can be served or cancelled by another worker without this
+    process seeing it. Tokens are served in id order, so serving a token
+    here also drops the join times of every earlier token. On top of that,
+    each queue keeps at most `max_waiting` join times, dropping the oldest.
+    """
+
+    def __init__(self, capacity=1000, max_waiting=10000):
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self._histories = {}
+        self._joined = {}  # professor id -> {token id: join time}, in the order tokens were added
+        self._lock = threading.Lock()
+
+    def history(self, professor_id):
+        history = self._histories.get(professor_id)
+        if history is None:
+            with self._lock:
+                history = self._histories.setdefault(professor_id, ServiceHistory(self.capacity))
+        return history
+
+    def record(self, professor_id, delta, now=None):
+        now = time.time() if now is None else now
+        kind = delta['type']
+        if kind == 'token_added':
+            waiting = self._joined.get(professor_id)
+            if waiting is None:
+                with self._lock:
+                    waiting = self._joined.setdefault(professor_id, {})
+            waiting[delta['token']['id']] = now
+            if len(waiting) > self.max_waiting:
+                del waiting[next(iter(waiting))]
+        elif kind == 'token_removed':
+            self._joined.get(professor_id, {}).pop(delta['id'], None)
+        elif kind == 'token_served':
+            token = delta['token']
+            if token is None:
+                self.history(professor_id).finished(now)
+                return
+            joined = self._served(professor_id, token['id'])
+            if joined is None:
+                joined = joined_at(token.get('timestamp'), now)
+            self.history(professor_id).served(token['type'], joined, now)
+        elif kind == 'current_cleared':
+            self.history(professor_id).finished(now)
+
+    def summary(self, professor_id):
+        history = self._histories.get(professor_id)
+        return history.summary() if history is not None else {'mean': None, 'by_type': {}}
+
+    def etas(self, professor_id, queue, positions=None):
+        """ServiceHistory.etas for one queue (all None before it has served anyone)"""
+        history = self._histories.get(professor_id)
+        if history is None:
+            return [None] * len(queue), {tid: None for tid in positions or ()}
+        return history.etas(queue, positions)
+
+    def stats(self):
+        return {professor_id: history.stats() for professor_id, history in list(self._histories.items())}
+
+    def _served(self, professor_id, token_id):
+        """Pop a served token's join time, and those of earlier tokens served elsewhere"""
+        waiting = self._joined.get(professor_id)
+        if not waiting:
+            return None
+        joined = waiting.pop(token_id, None)
+        while waiting:
+            first = next(iter(waiting))
+            if first > token_id:
+                break
+            del waiting[first]
+        return joined
+
+
+def joined_at(timestamp, now):
+    """Epoch time of an HH:MM:SS token timestamp, taken as the latest such time not after `now`"""
+    try:
+        clock = datetime.strptime(timestamp, '%H:%M:%S').time()
+    except (TypeError, ValueError):
+        return now
+    today = datetime.fromtimestamp(now)
+    joined = datetime.combine(today.date(), clock).timestamp()
+    return joined if joined <= now else joined - 86400
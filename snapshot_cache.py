@@ -0,0 +1,112 @@
+"""
+Pre-encoded queue snapshots for connect and resync storms.
+
+When a room full of clients reconnects at once, every connect and
+`get_state` would otherwise serialise the same snapshot again. SnapshotCache
+keeps one JSON encoding per queue and re-encodes only after the queue's
+version moves. The encoded text is sent as-is: `packet_json` is the JSON
+module given to Socket.IO, and it splices EncodedJSON arguments into the
+outgoing packet without decoding them. With another wire format, the cache
+holds whatever its `encode` function returns instead.
+"""
+import json
+import threading
+
+
+class EncodedJSON:
+    """JSON text that `packet_json.dumps` inserts verbatim"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class packet_json:
+    """Standard json for Socket.IO packets, plus EncodedJSON splicing"""
+
+    loads = staticmethod(json.loads)
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        # Event packets are encoded as [event name, *args]
+        if isinstance(obj, list) and any(isinstance(item, EncodedJSON) for item in obj):
+            return '[' + ','.join(
+                item.text if isinstance(item, EncodedJSON) else json.dumps(item, **kwargs)
+                for item in obj
+            ) + ']'
+        return json.dumps(obj, **kwargs)
+
+
+def encode_json(snapshot):
+    return EncodedJSON(json.dumps(snapshot, separators=(',', ':')))
+
+
+class SnapshotCache:
+    """
+    The latest encoded snapshot of each queue, keyed by professor id.
+
+    A lookup reads the queue's version (cheap on both backends) and reuses
+    the cached encoding unless the queue has moved on. Concurrent misses for
+    one queue wait on a per-queue lock, so a storm encodes it only once.
+    """
+
+    def __init__(self, backend, encode=encode_json):
+        self.backend = backend
+        self.encode = encode
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # professor id -> (version, encoded snapshot)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, professor_id, version=None):
+        """(version, encoded snapshot) for the queue's current state.
+
+        Pass `version` if the caller has just read it, to save a lookup.
+        """
+        if version is None:
+            version = self.backend.version(professor_id)
+        if version == 0:
+            # Never changed, possibly an id a client made up: not worth an entry
+            snap = self.backend.snapshot(professor_id)
+            return snap['version'], self.encode(snap)
+        entry = self._lookup(professor_id, version)
+        if entry is not None:
+            return entry
+        with self._lock_for(professor_id):
+            entry = self._lookup(professor_id, version)
+            if entry is not None:
+                return entry
+            snap = self.backend.snapshot(professor_id)
+            entry = (snap['version'], self.encode(snap))
+            self._entries[professor_id] = entry
+            with self._lock:
+                self.misses += 1
+            return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'queues': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def _lookup(self, professor_id, version):
+        entry = self._entries.get(professor_id)
+        # The cached snapshot can be newer than the version just read
+        if entry is None or entry[0] < version:
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def _lock_for(self, professor_id):
+        lock = self._locks.get(professor_id)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(professor_id, threading.Lock())
+        return lock
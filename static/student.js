@@ -1,5 +1,42 @@
-// Connect to Socket.IO server
-const socket = io();
+// Connect to Socket.IO server, subscribing to the queue named in ?professor=<id>.
+// The 'window' view (default) only receives the head of the queue and this
+// student's position; ?view=full or the toggle switches to the whole list.
+const params = new URLSearchParams(window.location.search);
+const professorId = params.get('professor') || 'default';
+const windowSize = parseInt(params.get('window'), 10) || 10;
+let view = params.get('view') || localStorage.getItem('queueView') || 'window';
+const socket = io({ query: { professor: professorId, view, window: windowSize } });
+
+// With the msgpack wire format, tokens arrive as positional arrays ordered like token_fields
+const tokenFields = WIRE_FORMAT.token_fields;
+
+function unpackToken(token) {
+    if (!tokenFields || !Array.isArray(token)) {
+        return token;
+    }
+    return Object.fromEntries(tokenFields.map((field, i) => [field, token[i]]));
+}
+
+function unpackState(payload) {
+    if (tokenFields) {
+        payload.current_token = unpackToken(payload.current_token);
+        if (payload.queue) {
+            payload.queue = payload.queue.map(unpackToken);
+        }
+    }
+    return payload;
+}
+
+// Stable id for this browser, so the server can refuse a second token after a reload
+let clientId = localStorage.getItem('lineup-client-id');
+if (!clientId) {
+    clientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    localStorage.setItem('lineup-client-id', clientId);
+}
+
+// Id of the token this student holds in this queue, kept across reloads
+const tokenKey = `lineup-token-${professorId}`;
+let myTokenId = sessionStorage.getItem(tokenKey) !== null ? Number(sessionStorage.getItem(tokenKey)) : null;
 
 // Theme Toggle
 const themeToggle = document.getElementById('themeToggle');
@@ -35,21 +72,144 @@ const statusEl = document.getElementById('status');
 const currentTokenEl = document.getElementById('current-token');
 const queueCountEl = document.getElementById('queue-count');
 const queueListEl = document.getElementById('queue-list');
+const myPositionEl = document.getElementById('my-position');
+const viewToggle = document.getElementById('view-toggle');
 const tokenForm = document.getElementById('token-form');
 
 // Handle connection
+// The server sends a snapshot (or view) on connect
 socket.on('connect', () => {
     console.log('Connected to server');
-    socket.emit('get_state');
+    if (myTokenId !== null) {
+        socket.emit('watch_token', { id: myTokenId });
+    }
 });
 
-// Handle state updates
-socket.on('state_update', (state) => {
+updateViewToggle();
+viewToggle.addEventListener('click', () => {
+    view = view === 'window' ? 'full' : 'window';
+    localStorage.setItem('queueView', view);
+    socket.io.opts.query.view = view;
+    updateViewToggle();
+    socket.emit('join_queue', { professor_id: professorId, view, window: windowSize });
+    if (myTokenId !== null) {
+        socket.emit('watch_token', { id: myTokenId });
+    }
+});
+
+function updateViewToggle() {
+    viewToggle.textContent = view === 'window' ? 'Show full queue' : `Show top ${windowSize}`;
+}
+
+// Local copy of the server state, kept current by applying deltas
+let state = null;
+// Set while a get_state is outstanding: deltas are dropped until the snapshot arrives
+let resyncPending = false;
+
+function requestState() {
+    if (!resyncPending) {
+        resyncPending = true;
+        socket.emit('get_state');
+    }
+}
+
+// Handle full snapshots (on connect and after a version gap)
+socket.on('state_update', (snapshot) => {
+    resyncPending = false;
+    state = unpackState(snapshot);
     updateStatus(state.professor_status);
     updateCurrentToken(state.current_token);
     updateQueue(state.queue);
+    updateMyPosition();
+});
+
+// Windowed view: the head of the queue plus its length, at most once per broadcast tick.
+// `queue` is left out when the head hasn't changed since the previous view.
+let viewVersion = -1;
+let viewQueue = [];
+socket.on('queue_view', (queueView) => {
+    queueView = unpackState(queueView);
+    if (view !== 'window' || queueView.version < viewVersion) {
+        return;  // Left over from before a view switch, or older than what we show
+    }
+    viewVersion = queueView.version;
+    if (queueView.queue) {
+        viewQueue = queueView.queue;
+    }
+    updateStatus(queueView.professor_status);
+    updateCurrentToken(queueView.current_token);
+    updateQueue(viewQueue, queueView.queue_length);
+});
+
+// Windowed view: this student's own position, sent when it changes
+socket.on('queue_position', (update) => {
+    if (update.token_id === myTokenId) {
+        showPosition(update.position, update.eta);
+    }
 });
 
+// Reply to a reconnect or get_state carrying a version we already have
+socket.on('state_current', (reply) => {
+    resyncPending = false;
+    console.log(`State is current at version ${reply.version}`);
+});
+
+// Handle versioned deltas, sent singly or batched per broadcast tick
+socket.on('state_delta', handleDelta);
+socket.on('state_deltas', (deltas) => deltas.forEach(handleDelta));
+
+function handleDelta(delta) {
+    if (delta.token) {
+        delta.token = unpackToken(delta.token);
+    }
+    if (!state || resyncPending || delta.version <= state.version) {
+        return;  // No snapshot yet, one is on its way, or a delta we already have
+    }
+    if (delta.version !== state.version + 1) {
+        // Missed at least one delta; fall back to a full snapshot
+        requestState();
+        return;
+    }
+    applyDelta(delta);
+    state.version = delta.version;
+    updateMyPosition();
+}
+
+function applyDelta(delta) {
+    switch (delta.type) {
+        case 'token_added':
+            // With several workers, ids can be added out of order and a snapshot
+            // from the shared backend can already include this token
+            if (!state.queue.some(t => t.id === delta.token.id)) {
+                insertQueueItem(delta.token);
+            }
+            break;
+        case 'token_served':
+            state.current_token = delta.token;
+            state.service_time = delta.service_time || state.service_time;
+            if (delta.token) {
+                removeQueueItem(delta.token.id);
+            }
+            updateCurrentToken(delta.token);
+            break;
+        case 'token_removed':
+            removeQueueItem(delta.id);
+            break;
+        case 'current_cleared':
+            state.current_token = null;
+            state.service_time = delta.service_time || state.service_time;
+            updateCurrentToken(null);
+            break;
+        case 'status_changed':
+            state.professor_status = delta.status;
+            updateStatus(delta.status);
+            break;
+        default:
+            // Unknown delta type from a newer server; resync
+            requestState();
+    }
+}
+
 // Update professor status
 function updateStatus(status) {
     statusEl.textContent = status;
@@ -71,24 +231,109 @@ function updateCurrentToken(token) {
     }
 }
 
-// Update queue display
-function updateQueue(queue) {
-    queueCountEl.textContent = queue.length;
-    
-    if (queue.length === 0) {
-        queueListEl.innerHTML = '<p class="empty-queue">Queue is empty</p>';
-        return;
-    }
-    
-    queueListEl.innerHTML = queue.map(token => `
-        <div class="queue-item">
+function queueItemHtml(token) {
+    return `
+        <div class="queue-item" data-token-id="${token.id}">
             <div class="queue-item-info">
                 <div class="queue-item-name">${token.name}</div>
                 <div class="queue-item-type">${token.type}</div>
             </div>
             <div class="queue-item-id">#${token.id}</div>
         </div>
-    `).join('');
+    `;
+}
+
+// Update queue display; `total` is the full queue length when only its head was sent
+function updateQueue(queue, total = queue.length) {
+    queueCountEl.textContent = total;
+    
+    if (queue.length === 0) {
+        queueListEl.innerHTML = '<p class="empty-queue">Queue is empty</p>';
+        return;
+    }
+    
+    let html = queue.map(queueItemHtml).join('');
+    if (total > queue.length) {
+        html += `<p class="queue-more">…and ${total - queue.length} more</p>`;
+    }
+    queueListEl.innerHTML = html;
+}
+
+// Full view: work out this student's position from the local queue
+function updateMyPosition() {
+    if (myTokenId === null || !state) {
+        return;
+    }
+    if (state.current_token && state.current_token.id === myTokenId) {
+        showPosition(0);
+        return;
+    }
+    const index = state.queue.findIndex(t => t.id === myTokenId);
+    showPosition(index === -1 ? null : index + 1, estimateWait(state.queue.slice(0, index)));
+}
+
+// Full view: seconds until the student is called, from mean service times per type
+function estimateWait(ahead) {
+    const serviceTime = state.service_time;
+    if (!serviceTime || serviceTime.mean === null) {
+        return null;
+    }
+    return ahead.reduce((total, t) => total + (serviceTime.by_type[t.type] ?? serviceTime.mean), 0);
+}
+
+function formatEta(seconds) {
+    return seconds < 60 ? 'under a minute' : `about ${Math.round(seconds / 60)} min`;
+}
+
+function showPosition(position, eta = null) {
+    if (position === null) {
+        // Served and cleared, or cancelled
+        myTokenId = null;
+        sessionStorage.removeItem(tokenKey);
+        myPositionEl.textContent = '–';
+    } else if (position === 0) {
+        myPositionEl.textContent = "You're being served!";
+    } else {
+        myPositionEl.textContent = eta === null || eta === undefined ? `#${position}` : `#${position} (${formatEta(eta)})`;
+    }
+}
+
+// Add a single token to the queue and its display, in id (arrival) order
+function insertQueueItem(token) {
+    let index = state.queue.length;
+    while (index > 0 && state.queue[index - 1].id > token.id) {
+        index--;
+    }
+    state.queue.splice(index, 0, token);
+    queueCountEl.textContent = state.queue.length;
+    const empty = queueListEl.querySelector('.empty-queue');
+    if (empty) {
+        empty.remove();
+    }
+    const next = index + 1 < state.queue.length
+        ? queueListEl.querySelector(`[data-token-id="${state.queue[index + 1].id}"]`)
+        : null;
+    if (next) {
+        next.insertAdjacentHTML('beforebegin', queueItemHtml(token));
+    } else {
+        queueListEl.insertAdjacentHTML('beforeend', queueItemHtml(token));
+    }
+}
+
+// Remove a single token from the queue display
+function removeQueueItem(tokenId) {
+    const index = state.queue.findIndex(t => t.id === tokenId);
+    if (index !== -1) {
+        state.queue.splice(index, 1);
+    }
+    const item = queueListEl.querySelector(`[data-token-id="${tokenId}"]`);
+    if (item) {
+        item.remove();
+    }
+    queueCountEl.textContent = state.queue.length;
+    if (state.queue.length === 0) {
+        queueListEl.innerHTML = '<p class="empty-queue">Queue is empty</p>';
+    }
 }
 
 // Handle token request form submission
@@ -103,19 +348,41 @@ tokenForm.addEventListener('submit', (e) => {
         return;
     }
     
-    // Send token request
-    socket.emit('request_token', { name, type });
+    // Send token request; the server replies with the new token's id or why it was refused
+    socket.emit('request_token', { name, type, client_id: clientId }, (reply) => {
+        if (reply.error) {
+            if (reply.error === 'duplicate' && reply.id != null) {
+                myTokenId = reply.id;
+                sessionStorage.setItem(tokenKey, reply.id);
+                updateMyPosition();
+                socket.emit('watch_token', { id: reply.id });
+            }
+            alert(reply.message);
+            return;
+        }
+        myTokenId = reply.id;
+        sessionStorage.setItem(tokenKey, reply.id);
+        updateMyPosition();
+        alert(`Token #${reply.id} requested successfully!\nName: ${name}\nType: ${type}`);
+    });
     
     // Reset form
     tokenForm.reset();
-    
-    // Show confirmation
-    alert(`Token requested successfully!\nName: ${name}\nType: ${type}`);
 });
 
 // Handle disconnection
 socket.on('disconnect', () => {
     console.log('Disconnected from server');
+    // A get_state sent before the drop may go unanswered; the reconnect resyncs instead
+    resyncPending = false;
+    // A restarted server without LINEUP_DATA_DIR counts versions from 0 again
+    viewVersion = -1;
+    // Reconnect with our version; if nothing changed the server replies `state_current`
+    if (state && view === 'full') {
+        socket.io.opts.query.version = state.version;
+    } else {
+        delete socket.io.opts.query.version;
+    }
     statusEl.textContent = 'Disconnected';
     statusEl.className = 'status-badge status-unavailable';
 });
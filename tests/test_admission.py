@@ -0,0 +1,47 @@
+"""ActiveTokens bookkeeping for request_token dedupe"""
+from admission import ActiveTokens
+
+
+def add(tokens, professor_id, clients, token_id):
+    assert tokens.reserve(professor_id, clients) == (True, None)
+    tokens.assign(professor_id, clients, token_id)
+
+
+def test_socket_or_client_id_with_a_waiting_token_is_refused():
+    tokens = ActiveTokens(lambda pid, token_id: True)
+    add(tokens, 'p', [('sid', 'a'), ('client', 'x')], 1)
+    assert tokens.reserve('p', [('sid', 'b'), ('client', 'x')]) == (False, 1)
+    assert tokens.reserve('p', [('sid', 'a'), ('client', 'y')]) == (False, 1)
+    assert tokens.reserve('q', [('sid', 'a'), ('client', 'x')]) == (True, None)
+
+
+def test_disconnect_drops_the_socket_id():
+    tokens = ActiveTokens(lambda pid, token_id: True)
+    add(tokens, 'p', [('sid', 'a')], 1)
+    add(tokens, 'q', [('sid', 'a'), ('client', 'x')], 2)
+    tokens.forget_client(('sid', 'a'))
+    assert tokens._owners == {('q', 2): (('sid', 'a'), ('client', 'x'))}
+    assert list(tokens._tokens) == [('q', ('client', 'x'))]
+    assert tokens.reserve('q', [('sid', 'b'), ('client', 'x')]) == (False, 2)
+    tokens.release('q', 2)
+    assert tokens._tokens == tokens._owners == tokens._clients == {}
+
+
+def test_remembered_tokens_are_bounded():
+    # Served through another worker: never released here
+    tokens = ActiveTokens(lambda pid, token_id: False, max_tokens=10)
+    for token_id in range(100):
+        add(tokens, 'p', [('client', token_id)], token_id)
+    assert len(tokens._owners) <= 10
+    assert len(tokens._tokens) == len(tokens._clients) == len(tokens._owners)
+
+
+def test_owner_is_either_key_until_released():
+    tokens = ActiveTokens(lambda pid, token_id: True)
+    add(tokens, 'p', [('sid', 'a'), ('client', 'x')], 1)
+    assert tokens.owns('p', [('sid', 'a')], 1)
+    assert tokens.owns('p', [('sid', 'b'), ('client', 'x')], 1)
+    assert not tokens.owns('p', [('sid', 'b')], 1)
+    assert not tokens.owns('q', [('sid', 'a')], 1)
+    tokens.release('p', 1)
+    assert not tokens.owns('p', [('sid', 'a')], 1)
@@ -0,0 +1,60 @@
+"""book_timeslot compensation when the booking insert fails, on mongomock"""
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+import db_mongo
+from pymongo.errors import OperationFailure
+
+
+@pytest.fixture
+def slot(monkeypatch):
+    monkeypatch.setattr(db_mongo, '_db', mongomock.MongoClient().get_database('lineup_test'))
+    start = datetime(2030, 1, 1, 10, 0)
+    return db_mongo.create_timeslot(start, start + timedelta(minutes=30), capacity=2)
+
+
+def failing(monkeypatch, collection, method, error):
+    original = getattr(mongomock.collection.Collection, method)
+
+    def call(self, *args, **kwargs):
+        if self.name == collection:
+            raise error
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, method, call)
+
+
+def booked_count(slot):
+    return db_mongo.get_db().timeslots.find_one({'_id': slot['_id']})['booked_count']
+
+
+def test_seat_is_released_when_the_booking_is_confirmed_missing(monkeypatch, slot):
+    failing(monkeypatch, 'bookings', 'insert_one', OperationFailure('insert failed'))
+    with pytest.raises(OperationFailure, match='insert failed'):
+        db_mongo.book_timeslot(str(slot['_id']), 'a')
+    assert booked_count(slot) == 0
+
+
+def test_seat_is_kept_when_the_booking_cannot_be_checked(monkeypatch, slot):
+    failing(monkeypatch, 'bookings', 'insert_one', OperationFailure('insert failed'))
+    failing(monkeypatch, 'bookings', 'find_one', OperationFailure('check failed'))
+    with pytest.raises(OperationFailure, match='insert failed'):
+        db_mongo.book_timeslot(str(slot['_id']), 'a')
+    assert booked_count(slot) == 1
+
+
+def test_failed_release_raises_the_insert_error(monkeypatch, slot):
+    failing(monkeypatch, 'bookings', 'insert_one', OperationFailure('insert failed'))
+    original = mongomock.collection.Collection.update_one
+    calls = []
+
+    def update_one(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) > 1:
+            raise OperationFailure('release failed')
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, 'update_one', update_one)
+    with pytest.raises(OperationFailure, match='insert failed'):
+        db_mongo.book_timeslot(str(slot['_id']), 'a')
@@ -0,0 +1,70 @@
+"""
+MongoBackend shared by several workers, with mongomock as the stand-in for
+mongod: each MongoBackend instance plays one server process.
+"""
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from queue_backend import MongoBackend
+
+
+@pytest.fixture
+def workers():
+    db = mongomock.MongoClient().get_database('lineup_test')
+    published = []
+    a = MongoBackend(db, lambda pid, delta: published.append(('a', pid, delta)))
+    b = MongoBackend(db, lambda pid, delta: published.append(('b', pid, delta)))
+    return a, b, published
+
+
+def test_token_ids_and_versions_are_shared(workers):
+    a, b, published = workers
+    for i in range(10):
+        (a if i % 2 else b).add_token('p', f"s{i}", 'Lab')
+    ids = [delta['token']['id'] for _, _, delta in published]
+    versions = [delta['version'] for _, _, delta in published]
+    assert sorted(ids) == list(range(1, 11))
+    assert versions == list(range(1, 11))
+    assert [t['id'] for t in a.snapshot('p')['queue']] == ids
+    assert a.snapshot('p') == b.snapshot('p')
+
+
+def test_serve_and_cancel_tokens_added_by_another_worker(workers):
+    a, b, _ = workers
+    first = a.add_token('p', 'x', 'Lab')['token']['id']
+    second = a.add_token('p', 'y', 'Lab')['token']['id']
+    assert b.serve_next('p')['token']['id'] == first
+    assert b.cancel_token('p', second)['id'] == second
+    snap = a.snapshot('p')
+    assert snap['current_token']['id'] == first
+    assert snap['queue'] == []
+    assert a.db.queue_shards.find_one({'_id': 'p'})['queue_length'] == 0
+
+
+def test_max_length_holds_across_workers(workers):
+    a, b, _ = workers
+    added = [(a if i % 2 else b).add_token('p', f"s{i}", 'Lab', max_length=3) for i in range(6)]
+    assert sum(delta is not None for delta in added) == 3
+    a.serve_next('p')
+    assert b.add_token('p', 'late', 'Lab', max_length=3) is not None
+
+
+def test_queues_are_independent(workers):
+    a, b, _ = workers
+    a.add_token('p', 'x', 'Lab')
+    b.add_token('q', 'y', 'Lab')
+    assert [t['name'] for t in a.snapshot('p')['queue']] == ['x']
+    assert [t['name'] for t in a.snapshot('q')['queue']] == ['y']
+    assert a.queue_depths() == {'p': 1, 'q': 1}
+
+
+def test_reads_do_not_create_shards(workers):
+    a, _, _ = workers
+    assert a.version('nobody') == 0
+    assert a.snapshot('nobody')['queue'] == []
+    view, positions = a.queue_view('nobody', 5, (1,))
+    assert view['queue_length'] == 0 and positions == {1: None}
+    assert a.db.queue_shards.count_documents({}) == 0
+    a.add_token('nobody', 'x', 'Lab')
+    assert a.version('nobody') == 1
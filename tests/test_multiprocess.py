@@ -0,0 +1,147 @@
+"""
+Two server processes sharing queues through MongoDB (LINEUP_QUEUE_BACKEND=mongo).
+
+Needs a mongod at MONGO_URI (default mongodb://localhost:27017); skipped
+otherwise, since an in-memory stand-in can't be shared between processes.
+Each run uses its own throwaway database.
+"""
+import threading
+import time
+import uuid
+
+import pytest
+
+socketio = pytest.importorskip('socketio')
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from db_mongo import get_mongo_uri
+from loadgen import ServerProcess, free_port
+
+
+def mongod_available():
+    try:
+        MongoClient(get_mongo_uri(), serverSelectionTimeoutMS=500).admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not mongod_available(), reason='needs a mongod at MONGO_URI')
+
+
+@pytest.fixture
+def workers():
+    db_name = f"lineup_test_{uuid.uuid4().hex[:8]}"
+    env = {
+        'LINEUP_QUEUE_BACKEND': 'mongo',
+        'MONGO_DB': db_name,
+        'LINEUP_LOG_LEVEL': 'WARNING',
+        'LINEUP_TOKEN_RATE': '0',
+        'LINEUP_ADDRESS_TOKEN_RATE': '0',
+        'LINEUP_DEDUPE_TOKENS': '0',
+    }
+    servers = [ServerProcess(free_port(), False, False, env) for _ in range(2)]
+    try:
+        for server in servers:
+            server.wait_ready()
+        yield servers
+    finally:
+        for server in servers:
+            server.stop()
+        MongoClient(get_mongo_uri()).drop_database(db_name)
+
+
+class Recorder:
+    def __init__(self, url, query):
+        self.events = []
+        self.lock = threading.Lock()
+        self.sio = socketio.Client(reconnection=False)
+        for event in ('state_update', 'state_delta', 'state_deltas', 'queue_view', 'queue_position'):
+            self.sio.on(event, self._recorder(event))
+        self.sio.connect(f"{url}?{query}", transports=['websocket'], wait_timeout=10)
+
+    def _recorder(self, event):
+        def record(data):
+            with self.lock:
+                self.events.append((event, data))
+        return record
+
+    def deltas(self):
+        with self.lock:
+            found = []
+            for event, data in self.events:
+                if event == 'state_delta':
+                    found.append(data)
+                elif event == 'state_deltas':
+                    found.extend(data)
+            return found
+
+    def named(self, event):
+        with self.lock:
+            return [data for name, data in self.events if name == event]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_deltas_reach_clients_on_every_worker(workers):
+    a, b = workers
+    watcher = Recorder(b.url, 'professor=mp&view=full')
+    student = Recorder(a.url, 'professor=mp&view=full')
+    try:
+        ids = [student.sio.call('request_token', {'name': f"s{i}", 'type': 'Lab'})['id'] for i in range(5)]
+        assert wait_for(lambda: len([d for d in watcher.deltas() if d['type'] == 'token_added']) == 5)
+        added = [d['token']['id'] for d in watcher.deltas() if d['type'] == 'token_added']
+        assert sorted(added) == sorted(ids)
+    finally:
+        watcher.sio.disconnect()
+        student.sio.disconnect()
+
+
+def test_token_ids_are_unique_across_workers(workers):
+    clients = [Recorder(server.url, 'professor=mp2&view=full') for server in workers for _ in range(2)]
+    ids = []
+    lock = threading.Lock()
+
+    def request(client, n):
+        for i in range(n):
+            token_id = client.sio.call('request_token', {'name': f"s{i}", 'type': 'Lab'})['id']
+            with lock:
+                ids.append(token_id)
+
+    threads = [threading.Thread(target=request, args=(client, 10)) for client in clients]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(ids) == len(set(ids)) == 40
+    finally:
+        for client in clients:
+            client.sio.disconnect()
+
+
+def test_windowed_views_are_not_duplicated_by_the_relay(workers):
+    a, b = workers
+    # Subscribers of the same queue on both workers
+    viewers = [Recorder(server.url, 'professor=mp3&view=window&window=5') for server in (a, b)]
+    student = Recorder(a.url, 'professor=mp3&view=full')
+    try:
+        assert wait_for(lambda: all(v.named('queue_view') for v in viewers))
+        student.sio.call('request_token', {'name': 's', 'type': 'Lab'})
+        assert wait_for(lambda: all(any(view.get('queue_length') == 1 for view in v.named('queue_view'))
+                                    for v in viewers))
+        time.sleep(0.5)
+        for viewer in viewers:
+            versions = [view['version'] for view in viewer.named('queue_view')]
+            assert len(versions) == len(set(versions))
+    finally:
+        for client in viewers + [student]:
+            client.sio.disconnect()
@@ -0,0 +1,88 @@
+"""ProfessorApp delta handling, without a Tk window"""
+from queue import SimpleQueue
+
+import pytest
+
+pytest.importorskip('pystray')
+pytest.importorskip('PIL')
+
+from professor_app import ProfessorApp
+
+
+class FakeRoot:
+    def after(self, ms, callback):
+        pass
+
+
+class FakeSocket:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data=None):
+        self.emitted.append(event)
+
+
+def app_with(queue, version):
+    app = ProfessorApp.__new__(ProfessorApp)
+    app.state = {'queue': list(queue), 'current_token': None, 'version': version}
+    app.row_changes = []
+    app.resync_pending = False
+    app.sio = FakeSocket()
+    return app
+
+
+def token(token_id):
+    return {'id': token_id, 'name': f"s{token_id}", 'type': 'Lab', 'timestamp': '10:00:00'}
+
+
+def test_out_of_order_ids_are_inserted_in_order():
+    # Worker B took id 6 after worker A took 5, but bumped the version first
+    app = app_with([token(4)], version=9)
+    assert app.apply_delta({'version': 10, 'type': 'token_added', 'token': token(6)})
+    assert app.apply_delta({'version': 11, 'type': 'token_added', 'token': token(5)})
+    assert [t['id'] for t in app.state['queue']] == [4, 5, 6]
+    assert app.sio.emitted == []
+
+
+def test_token_already_in_snapshot_is_not_added_twice():
+    app = app_with([token(4), token(5)], version=9)
+    assert app.apply_delta({'version': 10, 'type': 'token_added', 'token': token(4)})
+    assert [t['id'] for t in app.state['queue']] == [4, 5]
+    assert app.row_changes == []
+
+
+def test_gap_requests_one_snapshot_and_drops_deltas_until_it_arrives():
+    app = app_with([token(4)], version=9)
+    assert not app.apply_delta({'version': 11, 'type': 'token_added', 'token': token(6)})
+    for version in range(12, 20):
+        assert not app.apply_delta({'version': version, 'type': 'token_added', 'token': token(version)})
+    assert app.sio.emitted == ['get_state']
+    assert app.state['version'] == 9
+
+
+def view(version, professor_id='default'):
+    return {'professor_id': professor_id, 'professor_status': 'Available', 'current_token': None,
+            'queue_length': 1, 'queue': [token(version)], 'version': version}
+
+
+def test_views_restart_from_zero_after_a_reconnect():
+    app = app_with([], version=None)
+    app.professor_id, app.window = 'default', 5
+    app.root, app.ui_events = FakeRoot(), SimpleQueue()
+    app.update_connection_status = lambda connected: None
+    app.update_ui = lambda: None
+    app.ui_events.put(('view', view(40)))
+    app.drain_ui_events()
+    # The server restarted without LINEUP_DATA_DIR: versions count from 0 again
+    for event in [('connected', False), ('connected', True), ('view', view(1)), ('view', view(2))]:
+        app.ui_events.put(event)
+    app.drain_ui_events()
+    assert app.state['version'] == 2
+
+
+def test_first_view_of_a_newly_selected_queue_is_applied():
+    app = app_with([], version=None)
+    assert app.apply_view(view(40, 'a'))
+    assert not app.apply_view(view(39, 'a'))
+    assert app.apply_view(view(3, 'b'))
+    assert app.state['version'] == 3
@@ -0,0 +1,20 @@
+"""InProcessBackend and SnapshotCache with professor ids nobody has used"""
+from queue_backend import InProcessBackend
+from snapshot_cache import SnapshotCache
+
+
+def test_reads_do_not_create_shards():
+    backend = InProcessBackend(lambda pid, delta: None)
+    cache = SnapshotCache(backend)
+    assert backend.version('nobody') == 0
+    assert backend.snapshot('nobody')['queue'] == []
+    assert backend.queue_view('nobody', 5, (1,))[1] == {1: None}
+    assert not backend.is_queued('nobody', 1)
+    assert cache.get('nobody')[0] == 0
+    assert len(backend.shards) == 0
+    assert backend.queue_depths() == {}
+    assert cache.stats()['queues'] == 0
+
+    backend.add_token('nobody', 'x', 'Lab')
+    assert cache.get('nobody')[0] == 1
+    assert backend.queue_depths() == {'nobody': 1}
@@ -0,0 +1,21 @@
+"""QueueLog snapshots written by the flusher thread, and recovery from them"""
+from queue_log import QueueLog
+from queue_shard import ShardRegistry
+
+
+def test_queued_snapshot_is_written_by_the_flusher(tmp_path):
+    shards = ShardRegistry()
+    log = QueueLog(str(tmp_path), flush_interval=0.01)
+    log.start()
+    shard = shards.get('p')
+    for name in 'abc':
+        log.append('p', shard.add_token(name, 'Lab'))
+    segment = log.rotate()
+    log.queue_snapshot(segment, [shard.snapshot()])
+    log.append('p', shard.serve_next())
+    log.close()
+    assert log._segments() == [segment]
+
+    recovered = ShardRegistry()
+    assert QueueLog(str(tmp_path)).recover(recovered) == 1
+    assert recovered.get('p').snapshot() == shard.snapshot()
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from recurrence import expand_recurrence, parse_capacity, parse_slot
+
+RULE = {'start_date': '2026-01-05', 'end_date': '2026-01-10', 'start_time': '10:00', 'duration_minutes': 20}
+SLOT = {'start_ts': '2026-01-01T10:00', 'end_ts': '2026-01-01T11:00'}
+
+
+@pytest.mark.parametrize('value', [None, 0, -1, 1.5, 'abc', '', True, [], {}])
+def test_bad_capacities_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_capacity(value)
+
+
+@pytest.mark.parametrize('value, expected', [(1, 1), (3.0, 3), ('2', 2)])
+def test_whole_number_capacities_are_accepted(value, expected):
+    assert parse_capacity(value) == expected
+
+
+@pytest.mark.parametrize('rule', [
+    [1], 'weekly', None, dict(RULE, capacity=None), dict(RULE, weekdays=5),
+    dict(RULE, duration_minutes=10 ** 10), dict(RULE, duration_minutes=10 ** 13),
+    dict(RULE, start_date='9999-12-31', end_date='9999-12-31', start_time='23:00', duration_minutes=120),
+    dict(RULE, freq='daily', interval=10 ** 9, start_date='0001-01-01', end_date='9999-12-31'),
+])
+def test_malformed_rules_raise_value_error(rule):
+    with pytest.raises(ValueError):
+        expand_recurrence(rule)
+
+
+@pytest.mark.parametrize('slot', [
+    1, None, dict(SLOT, capacity=None), dict(SLOT, capacity='x'),
+    dict(SLOT, start_ts='0001-01-01T00:00+05:00'),
+])
+def test_malformed_slots_raise_value_error(slot):
+    with pytest.raises(ValueError):
+        parse_slot(slot)
+
+
+def test_valid_rule_expands():
+    slots = expand_recurrence(dict(RULE, weekdays=['mon', 'thu'], capacity='2'))
+    assert [s['start_ts'].day for s in slots] == [5, 8]
+    assert all(s['capacity'] == 2 for s in slots)
+
+
+def test_intervals_step_by_occurrence():
+    weekly = expand_recurrence(dict(RULE, end_date='2026-02-01', weekdays=['mon', 'fri'], interval=2))
+    assert [s['start_ts'].day for s in weekly] == [5, 9, 19, 23]
+    daily = expand_recurrence(dict(RULE, freq='daily', end_date='2026-01-14', interval=3))
+    assert [s['start_ts'].day for s in daily] == [5, 8, 11, 14]
+
+
+@pytest.mark.parametrize('start_ts', ['2026-01-01T10:00Z', '2026-01-01T15:30+05:30', '20260101T1000'])
+def test_slots_accept_what_single_timeslot_creation_accepts(start_ts):
+    slot = parse_slot({'start_ts': start_ts, 'end_ts': '2026-01-01T11:00Z'})
+    assert slot['start_ts'] == datetime(2026, 1, 1, 10, 0)
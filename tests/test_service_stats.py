@@ -0,0 +1,36 @@
+"""ServiceStats join-time bookkeeping and service-time means"""
+from service_stats import ServiceStats
+
+
+def added(token_id):
+    return {'type': 'token_added', 'token': {'id': token_id, 'type': 'Lab', 'timestamp': '10:00:00'}}
+
+
+def served(token_id):
+    return {'type': 'token_served', 'token': {'id': token_id, 'type': 'Lab', 'timestamp': '10:00:00'}}
+
+
+def test_service_and_wait_means():
+    stats = ServiceStats()
+    stats.record('p', added(1), now=100)
+    stats.record('p', added(2), now=110)
+    stats.record('p', served(1), now=130)
+    stats.record('p', served(2), now=190)
+    assert stats.summary('p') == {'mean': 60.0, 'by_type': {'Lab': 60.0}}
+    assert stats.stats()['p']['mean_wait'] == (30 + 80) / 2
+
+
+def test_tokens_served_by_another_worker_are_forgotten():
+    stats = ServiceStats()
+    for token_id in range(1, 6):
+        stats.record('p', added(token_id), now=100)
+    # Tokens 1-3 were served through another worker
+    stats.record('p', served(4), now=200)
+    assert list(stats._joined['p']) == [5]
+
+
+def test_join_times_are_bounded_per_queue():
+    stats = ServiceStats(max_waiting=3)
+    for token_id in range(1, 11):
+        stats.record('p', added(token_id), now=100)
+    assert list(stats._joined['p']) == [8, 9, 10]
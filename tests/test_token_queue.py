@@ -0,0 +1,24 @@
+"""TokenQueue against a plain list, with cancellations interleaved"""
+import random
+
+from token_queue import Token, TokenQueue
+
+
+def test_matches_a_list_under_random_operations():
+    rng = random.Random(7)
+    queue, expected, next_id = TokenQueue(), [], 0
+    for _ in range(5000):
+        op = rng.random()
+        if op < 0.45:
+            queue.append(Token(next_id, 'x', 'Lab', '10:00:00'))
+            expected.append(next_id)
+            next_id += 1
+        elif op < 0.7 and expected:
+            assert queue.popleft().id == expected.pop(0)
+        elif expected:
+            token_id = rng.choice(expected)
+            expected.remove(token_id)
+            assert queue.remove(token_id).id == token_id
+        for token_id in rng.sample(expected, min(3, len(expected))):
+            assert queue.position(token_id) == expected.index(token_id) + 1
+    assert [token.id for token in queue] == expected
@@ -0,0 +1,134 @@
+from bisect import bisect_left, insort
+from collections import deque
+
+
+class Token:
+    """A queued student request. Uses __slots__ to keep per-token memory small."""
+
+    __slots__ = ('id', 'name', 'type', 'timestamp', 'seq', 'cancelled')
+
+    def __init__(self, id, name, type, timestamp):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.timestamp = timestamp
+        self.seq = -1  # Assigned by TokenQueue on enqueue
+        self.cancelled = False
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': self.type,
+            'timestamp': self.timestamp
+        }
+
+    def __repr__(self):
+        return f"Token(id={self.id!r}, name={self.name!r}, type={self.type!r})"
+
+
+class TokenQueue:
+    """
+    FIFO token queue with O(1) enqueue and lookup and amortised O(1) dequeue.
+
+    Every token gets a sequence number when it is enqueued. Its position is
+    its distance from the head minus the number of cancelled tokens still
+    ahead of it. Cancelled tokens are left in the deque as tombstones and
+    skipped on dequeue, so removal never shifts the deque; their seqs are
+    kept in a sorted list. With c pending cancellations, removal by id is
+    O(c) (an insort, a memmove of at most c entries), and position queries
+    are O(1) when nothing is cancelled and O(log c) otherwise.
+    """
+
+    def __init__(self):
+        self._order = deque()   # Tokens in arrival order, including tombstones
+        self._by_id = {}        # token id -> Token, live tokens only
+        self._cancelled = []    # Sorted seqs of tombstones; those from _cancelled_head on are still in _order
+        self._cancelled_head = 0
+        self._next_seq = 0
+        self._popped = 0        # Number of entries popped off the head of _order
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __bool__(self):
+        return bool(self._by_id)
+
+    def __contains__(self, token_id):
+        return token_id in self._by_id
+
+    def __iter__(self):
+        for token in self._order:
+            if not token.cancelled:
+                yield token
+
+    def append(self, token):
+        if token.id in self._by_id:
+            raise ValueError(f"Token {token.id} is already queued")
+        token.seq = self._next_seq
+        self._next_seq += 1
+        self._order.append(token)
+        self._by_id[token.id] = token
+        return token
+
+    def popleft(self):
+        """Remove and return the token at the head of the queue"""
+        if not self._by_id:
+            raise IndexError('pop from an empty TokenQueue')
+        self._drop_tombstones()
+        token = self._order.popleft()
+        self._popped += 1
+        del self._by_id[token.id]
+        return token
+
+    def peek(self):
+        """Return the token at the head of the queue without removing it"""
+        if not self._by_id:
+            return None
+        self._drop_tombstones()
+        return self._order[0]
+
+    def get(self, token_id):
+        return self._by_id.get(token_id)
+
+    def remove(self, token_id):
+        """Cancel a token by id. Returns the removed token, or None."""
+        token = self._by_id.pop(token_id, None)
+        if token is None:
+            return None
+        token.cancelled = True
+        insort(self._cancelled, token.seq, self._cancelled_head)
+        if not self._by_id:
+            # Nothing live left; drop the tombstones eagerly
+            self._popped += len(self._order)
+            self._order.clear()
+            self._cancelled.clear()
+            self._cancelled_head = 0
+        return token
+
+    def position(self, token_id):
+        """1-based position of a token in the queue, or None if not queued"""
+        token = self._by_id.get(token_id)
+        if token is None:
+            return None
+        ahead = token.seq - self._popped
+        head = self._cancelled_head
+        if len(self._cancelled) > head:
+            ahead -= bisect_left(self._cancelled, token.seq, head) - head
+        return ahead + 1
+
+    def to_list(self):
+        return [token.to_dict() for token in self]
+
+    def _drop_tombstones(self):
+        order = self._order
+        while order[0].cancelled:
+            order.popleft()
+            self._popped += 1
+            # Tombstones leave the head in seq order, so this is always the smallest
+            # pending one. Dropped seqs are trimmed in bulk, not one memmove each.
+            self._cancelled_head += 1
+        head = self._cancelled_head
+        if head and head * 2 >= len(self._cancelled):
+            del self._cancelled[:head]
+            self._cancelled_head = 0
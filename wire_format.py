@@ -0,0 +1,86 @@
+"""
+Wire formats for queue payloads.
+
+- json (default): Socket.IO's JSON packets, with tokens as dicts.
+- msgpack: python-socketio's MessagePack serializer, with every token sent
+  as a positional list ordered like TOKEN_FIELDS instead of a dict, so keys
+  are not repeated for each token.
+
+python-socketio uses one serializer for a whole server, so the format is
+chosen per deployment with LINEUP_WIRE_FORMAT. Clients read it from
+/api/wire-format (the student page has it rendered in) and set up a matching
+parser before connecting.
+"""
+TOKEN_FIELDS = ('id', 'name', 'type', 'timestamp')
+WIRE_FORMATS = ('json', 'msgpack')
+
+
+def pack_token(token):
+    if token is None:
+        return None
+    return [token['id'], token['name'], token['type'], token['timestamp']]
+
+
+def unpack_token(values):
+    if values is None:
+        return None
+    return dict(zip(TOKEN_FIELDS, values))
+
+
+def pack_state(state):
+    """Compact copy of a snapshot or queue view"""
+    state = dict(state)
+    if 'current_token' in state:
+        state['current_token'] = pack_token(state['current_token'])
+    if 'queue' in state:
+        state['queue'] = [pack_token(token) for token in state['queue']]
+    return state
+
+
+def unpack_state(state):
+    state = dict(state)
+    if 'current_token' in state:
+        state['current_token'] = unpack_token(state['current_token'])
+    if 'queue' in state:
+        state['queue'] = [unpack_token(values) for values in state['queue']]
+    return state
+
+
+def pack_delta(delta):
+    if delta.get('token') is None:
+        return delta
+    return dict(delta, token=pack_token(delta['token']))
+
+
+def unpack_delta(delta):
+    if delta.get('token') is None:
+        return delta
+    return dict(delta, token=unpack_token(delta['token']))
+
+
+class WireFormat:
+    """Server-side encoding of queue payloads for one wire format"""
+
+    def __init__(self, name='json'):
+        if name not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire format {name!r}; expected one of {', '.join(WIRE_FORMATS)}")
+        self.name = name
+        self.compact = name == 'msgpack'
+
+    @property
+    def serializer(self):
+        """python-socketio `serializer` argument"""
+        return 'msgpack' if self.compact else 'default'
+
+    def state(self, state):
+        return pack_state(state) if self.compact else state
+
+    def delta(self, delta):
+        return pack_delta(delta) if self.compact else delta
+
+    def describe(self):
+        """What /api/wire-format tells clients"""
+        return {
+            'format': self.name,
+            'token_fields': list(TOKEN_FIELDS) if self.compact else None
+        }